@@ -17,4 +17,7 @@ from pydgraph.proto.api_pb2 import Operation, Payload, Request, Response, Mutati
 from pydgraph.client_stub import *
 from pydgraph.client import *
 from pydgraph.txn import *
+from pydgraph.async_client_stub import *
+from pydgraph.async_client import *
+from pydgraph.async_txn import *
 from pydgraph.errors import *
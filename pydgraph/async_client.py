@@ -0,0 +1,157 @@
+# Copyright 2023 Dgraph Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Dgraph python client using asyncio."""
+
+import asyncio
+import random
+import time
+
+from pydgraph import async_txn, util
+from pydgraph.client import (_CHECK_REQ, _LOGIN_RETRIES, _DgraphClientBase,
+                             _is_transient_login_error,
+                             _raise_mapped_alter_error)
+from pydgraph.meta import VERSION
+from pydgraph.proto import api_pb2 as api
+
+__maintainer__ = 'Dgraph Labs <contact@dgraph.io>'
+__version__ = VERSION
+__status__ = 'development'
+
+
+class AsyncDgraphClient(_DgraphClientBase):
+    """Creates a new asyncio Client for interacting with the Dgraph store.
+
+    The client is backed by one or more AsyncDgraphClientStub instances and
+    its request methods are coroutines. Concurrent requests, for instance
+    run with asyncio.gather, share the connections of its stubs.
+    """
+
+    def __init__(self, *clients):
+        super(AsyncDgraphClient, self).__init__(*clients)
+        # asyncio.Lock binds to the running event loop on Python < 3.10, so
+        # it is created on first use rather than here.
+        self._jwt_lock = None
+
+    async def check_version(self, timeout=None, metadata=None, credentials=None):
+        """Returns the version of Dgraph if the server is ready to accept requests."""
+        response = await self._invoke(self._rpc('check_version'), _CHECK_REQ,
+                                      timeout, metadata, credentials)
+        return response.tag
+
+    async def warmup(self, timeout=None, metadata=None, credentials=None):
+        """Checks every client concurrently and returns their Dgraph versions."""
+        new_metadata = self.add_login_metadata(metadata)
+        responses = await asyncio.gather(*[
+            client.check_version(_CHECK_REQ, timeout=timeout,
+                                 metadata=new_metadata, credentials=credentials)
+            for client in self._clients])
+        return [response.tag for response in responses]
+
+    async def login(self, userid, password, timeout=None, metadata=None,
+                    credentials=None):
+        await self.login_into_namespace(userid, password, 0, timeout=timeout,
+                                        metadata=metadata,
+                                        credentials=credentials)
+
+    async def login_into_namespace(self, userid, password, namespace,
+                                   timeout=None, metadata=None,
+                                   credentials=None):
+        login_req = api.LoginRequest()
+        login_req.userid = userid
+        login_req.password = password
+        login_req.namespace = namespace
+
+        response = await self._rpc('login')(login_req, timeout=timeout,
+                                            metadata=metadata,
+                                            credentials=credentials)
+        self._set_jwt(response)
+
+    async def retry_login(self, timeout=None, metadata=None, credentials=None):
+        if len(self._jwt.refresh_jwt) == 0:
+            raise ValueError('refresh jwt should not be empty')
+
+        login_req = api.LoginRequest()
+        login_req.refresh_token = self._jwt.refresh_jwt
+
+        for attempt in range(_LOGIN_RETRIES):
+            try:
+                response = await self._rpc('login')(login_req, timeout=timeout,
+                                                    metadata=metadata,
+                                                    credentials=credentials)
+                break
+            except Exception as error:
+                if (attempt == _LOGIN_RETRIES - 1 or
+                        not _is_transient_login_error(error)):
+                    raise error
+                await asyncio.sleep(min(2 ** attempt, 5) + random.random() * 0.25)
+
+        self._set_jwt(response)
+
+    async def _invoke(self, rpc, req, timeout, metadata, credentials):
+        """Sends req with the stub method rpc and the login metadata.
+
+        If the access JWT has expired, it is refreshed and the request is
+        sent once more. Transactions send their requests through here too.
+        """
+        await self._refresh_jwt_if_due()
+        jwt_version = self._jwt_version
+        try:
+            return await rpc(req, timeout=timeout,
+                             metadata=self.add_login_metadata(metadata),
+                             credentials=credentials)
+        except Exception as error:
+            if not util.is_jwt_expired(error):
+                raise
+            await self._retry_login_once(jwt_version)
+            return await rpc(req, timeout=timeout,
+                             metadata=self.add_login_metadata(metadata),
+                             credentials=credentials)
+
+    async def _refresh_jwt_if_due(self):
+        """Refreshes the access JWT if it is about to expire."""
+        refresh_at = self._jwt_refresh_at
+        if refresh_at is not None and time.time() >= refresh_at:
+            try:
+                await self._retry_login_once(self._jwt_version)
+            except Exception:
+                # As in DgraphClient, the request is sent with the current,
+                # still valid token instead.
+                self._jwt_refresh_at = None
+
+    async def _retry_login_once(self, jwt_version):
+        """Refreshes the JWT unless it changed since jwt_version was read."""
+        if self._jwt_lock is None:
+            self._jwt_lock = asyncio.Lock()
+        async with self._jwt_lock:
+            if self._jwt_version == jwt_version:
+                await self.retry_login()
+
+    async def alter(self, operation, timeout=None, metadata=None, credentials=None):
+        """Runs a modification via this client."""
+        try:
+            return await self._invoke(self._rpc('alter'), operation,
+                                      timeout, metadata, credentials)
+        except Exception as error:
+            _raise_mapped_alter_error(error)
+
+    async def close(self, grace=None):
+        """Closes all the client stubs of this client concurrently, each
+        waiting up to grace seconds for its calls in flight."""
+        await asyncio.gather(*[client.close(grace) for client in self._clients])
+
+    def txn(self, read_only=False, best_effort=False):
+        """Creates a transaction."""
+        return async_txn.AsyncTxn(self, read_only=read_only,
+                                  best_effort=best_effort)
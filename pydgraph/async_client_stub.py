@@ -0,0 +1,160 @@
+# Copyright 2023 Dgraph Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Stub for RPC request using asyncio."""
+
+import asyncio
+
+from grpc import aio
+
+from pydgraph.client_stub import (_KEEPALIVE_OPTIONS, _RPC_PICKERS,
+                                  DgraphClientStub, _merge_options,
+                                  _root_ssl_credentials, _rpc_picker)
+from pydgraph.meta import VERSION
+from pydgraph.proto import api_pb2_grpc as api_grpc
+
+__maintainer__ = 'Dgraph Labs <contact@dgraph.io>'
+__version__ = VERSION
+__status__ = 'development'
+
+
+class _StaticMetadataInterceptor(aio.UnaryUnaryClientInterceptor):
+    """asyncio client interceptor adding fixed metadata to every call."""
+
+    __slots__ = ('_metadata',)
+
+    def __init__(self, metadata):
+        self._metadata = tuple(metadata)
+
+    async def intercept_unary_unary(self, continuation, details, request):
+        metadata = aio.Metadata(*tuple(details.metadata or ()), *self._metadata)
+        return await continuation(details._replace(metadata=metadata), request)
+
+
+def _make_rpc(name, picker, doc):
+    """Returns an AsyncDgraphClientStub method sending a request with the
+    callable given by the picker attribute.
+
+    The method returns the grpc.aio call, which is awaited for the response.
+    Unlike in DgraphClientStub, the arguments are passed on as keywords, since
+    grpc.aio's UnaryUnaryMultiCallable only accepts them that way.
+    """
+    def rpc(self, req, timeout=None, metadata=None, credentials=None):
+        return getattr(self, picker)()(req, timeout=timeout, metadata=metadata,
+                                       credentials=credentials,
+                                       wait_for_ready=self._wait_for_ready)
+    rpc.__name__ = name
+    rpc.__qualname__ = 'AsyncDgraphClientStub.' + name
+    rpc.__doc__ = doc
+    return rpc
+
+
+class AsyncDgraphClientStub(object):
+    """Stub for the Dgraph grpc client using grpc.aio.
+
+    Its RPC methods return awaitable calls, so many requests can be in flight
+    on one channel from a single event loop thread. The stub must be created
+    and used from the event loop that runs the requests.
+
+    channel, pool_size, disable_keepalive, compression, interceptors and
+    wait_for_ready behave as in DgraphClientStub. An existing channel must be
+    a grpc.aio channel.
+    """
+
+    def __init__(self, addr='localhost:9080', credentials=None, options=None,
+                 channel=None, pool_size=1, disable_keepalive=False,
+                 compression=None, interceptors=None, wait_for_ready=None):
+        if pool_size < 1:
+            raise ValueError('pool_size must be at least 1')
+
+        self._closed = False
+        self._wait_for_ready = wait_for_ready
+        if channel is not None:
+            if pool_size != 1:
+                raise ValueError('pool_size cannot be used with an existing channel')
+            if compression is not None or interceptors:
+                raise ValueError('compression and interceptors cannot be used '
+                                 'with an existing channel')
+            self._owns_channel = False
+            channels = [channel]
+        else:
+            if not disable_keepalive:
+                options = _merge_options(options, _KEEPALIVE_OPTIONS)
+            if pool_size > 1:
+                # See DgraphClientStub: without a local subchannel pool the
+                # channels would share one connection.
+                options = list(options or []) + [('grpc.use_local_subchannel_pool', 1)]
+            self._owns_channel = True
+            channels = [self._create_channel(addr, credentials, options,
+                                             compression, interceptors)
+                        for _ in range(pool_size)]
+
+        self._channels = channels
+        stubs = [api_grpc.DgraphStub(c) for c in channels]
+        for attr, method in _RPC_PICKERS:
+            setattr(self, attr, _rpc_picker(stubs, method))
+        self.channel = channels[0]
+        self.stub = stubs[0]
+
+    @staticmethod
+    def _create_channel(addr, credentials, options, compression=None,
+                        interceptors=None):
+        if credentials is None:
+            return aio.insecure_channel(addr, options, compression,
+                                        interceptors)
+        return aio.secure_channel(addr, credentials, options, compression,
+                                  interceptors)
+
+    login = _make_rpc('login', '_login', 'Logs in to the Dgraph instance.')
+    alter = _make_rpc('alter', '_alter', 'Runs alter operation.')
+    query = _make_rpc('query', '_query', 'Runs query or mutate operation.')
+    commit_or_abort = _make_rpc('commit_or_abort', '_commit_or_abort',
+                                'Runs commit or abort operation.')
+    check_version = _make_rpc('check_version', '_check_version',
+                              'Returns the version of the Dgraph instance.')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self, grace=None):
+        """Deletes channel and stub. The channel is only closed if it was
+        created by this stub, after waiting up to grace seconds for calls in
+        flight. Closing a stub more than once is a no-op."""
+        if self._closed:
+            return
+        self._closed = True
+
+        if self._owns_channel:
+            # Channels of a pool are closed concurrently, as each may wait
+            # for its calls in flight.
+            await asyncio.gather(*[channel.close(grace)
+                                   for channel in self._channels],
+                                 return_exceptions=True)
+        del self.channel
+        del self.stub
+
+    parse_host = staticmethod(DgraphClientStub.parse_host)
+
+    @staticmethod
+    def from_cloud(cloud_endpoint, api_key, options=None):
+        """Returns an asyncio Dgraph Client stub for the Dgraph Cloud endpoint"""
+        host = DgraphClientStub.parse_host(cloud_endpoint)
+        options = _merge_options(options, (('grpc.enable_http_proxy', 0),))
+        auth = _StaticMetadataInterceptor((('authorization', api_key),))
+        return AsyncDgraphClientStub('{host}:{port}'.format(
+            host=host, port="443"), _root_ssl_credentials(), options=options,
+            interceptors=[auth])
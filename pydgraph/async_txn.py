@@ -0,0 +1,109 @@
+# Copyright 2023 Dgraph Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Dgraph atomic transaction support using asyncio."""
+
+from pydgraph.meta import VERSION
+from pydgraph.txn import _TxnBase
+
+__maintainer__ = 'Dgraph Labs <contact@dgraph.io>'
+__version__ = VERSION
+__status__ = 'development'
+
+
+class AsyncTxn(_TxnBase):
+    """AsyncTxn is a single atomic transaction run with asyncio.
+
+    It follows the lifecycle of Txn, but query, mutate, commit and discard
+    are coroutines. It can be used as an async context manager, which
+    discards the transaction on exit unless it was committed.
+    """
+
+    async def query(self, query, variables=None, timeout=None, metadata=None,
+                    credentials=None, resp_format="JSON"):
+        """Executes a query operation."""
+        req = self.create_request(query=query, variables=variables,
+                                  resp_format=resp_format)
+        return await self.do_request(req, timeout=timeout, metadata=metadata,
+                                     credentials=credentials)
+
+    async def mutate(self, mutation=None, set_obj=None, del_obj=None,
+                     set_nquads=None, del_nquads=None, cond=None,
+                     commit_now=None, timeout=None, metadata=None,
+                     credentials=None):
+        """Executes a mutate operation."""
+        mutation = self.create_mutation(mutation, set_obj, del_obj, set_nquads,
+                                        del_nquads, cond)
+        commit_now = commit_now or mutation.commit_now
+        req = self.create_request(commit_now=commit_now)
+        req.mutations.append(mutation)
+        return await self.do_request(req, timeout=timeout, metadata=metadata,
+                                     credentials=credentials)
+
+    async def do_request(self, request, timeout=None, metadata=None,
+                         credentials=None):
+        """Executes a query/mutate operation on the server."""
+        self._common_request(request)
+        try:
+            response = await self._dg._invoke(self._dc.query, request, timeout,
+                                              metadata, credentials)
+        except Exception as error:
+            try:
+                await self.discard(timeout=timeout, metadata=metadata,
+                                   credentials=credentials)
+            except Exception:
+                # Ignore error - user should see the original error. A
+                # cancellation is not an error and is left to propagate.
+                pass
+
+            self._common_except_mutate(error)
+
+        if request.commit_now:
+            self._finished = True
+
+        self.merge_context(response.txn)
+        return response
+
+    async def commit(self, timeout=None, metadata=None, credentials=None):
+        """Commits the transaction."""
+        if not self._common_commit():
+            return
+
+        try:
+            return await self._dg._invoke(self._dc.commit_or_abort, self._ctx,
+                                          timeout, metadata, credentials)
+        except Exception as error:
+            self._common_except_commit(error)
+
+    async def discard(self, timeout=None, metadata=None, credentials=None):
+        """Discards the transaction."""
+        if not self._common_discard():
+            return
+
+        await self._dg._invoke(self._dc.commit_or_abort, self._ctx, timeout,
+                               metadata, credentials)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        try:
+            await self.discard()
+        except Exception:
+            if exc_type is None:
+                raise
+            # Ignore error - user should see the original error.
+
+    async def retry_login(self):
+        await self._dg.retry_login()
@@ -14,7 +14,13 @@
 
 """Dgraph python client."""
 
+import itertools
 import random
+import threading
+import time
+from concurrent import futures
+
+import grpc
 
 from pydgraph import errors, txn, util
 from pydgraph.meta import VERSION
@@ -25,57 +31,301 @@ __maintainer__ = 'Dgraph Labs <contact@dgraph.io>'
 __version__ = VERSION
 __status__ = 'development'
 
+# Number of times retry_login tries to refresh the JWT before giving up.
+_LOGIN_RETRIES = 3
 
-class DgraphClient(object):
-    """Creates a new Client for interacting with the Dgraph store.
+# Seconds before its expiry at which an access JWT is refreshed ahead of use.
+_JWT_REFRESH_SKEW = 10
 
-    The client can be backed by multiple connections (to the same server, or
-    multiple servers in a cluster).
+# Check has no fields, so a single instance can be sent with every request.
+_CHECK_REQ = api.Check()
+
+# Methods whose requests can be sent with DgraphClient.pipeline.
+_PIPELINE_METHODS = frozenset(('alter', 'query', 'check_version'))
+
+
+def _raise_mapped_alter_error(error):
+    """Raises the pydgraph error matching an error returned by alter."""
+    msg = str(error)
+    if util.is_retriable_error(msg):
+        raise errors.RetriableError(error)
+
+    if util.is_connection_error(msg):
+        raise errors.ConnectionError(error)
+
+    raise error
+
+
+class _AlterFuture(grpc.Call, grpc.Future):
+    """Future returned by DgraphClient.async_alter.
+
+    It completes with the outcome of the gRPC call sending the operation.
+    When the operation is sent again after an expired JWT, the new call
+    replaces the first one, so cancel and the grpc.Call methods always act
+    on the call in flight.
+    """
+
+    def __init__(self, call):
+        self._call = call
+        self._lock = threading.Lock()
+        self._outcome = futures.Future()
+
+    def _set_call(self, call):
+        """Replaces the call in flight, cancelling it if this future was
+        cancelled meanwhile."""
+        with self._lock:
+            self._call = call
+            cancelled = self._outcome.cancelled()
+        if cancelled:
+            call.cancel()
+
+    def _finish(self, result=None, error=None):
+        with self._lock:
+            if self._outcome.done():
+                return
+            if error is None:
+                self._outcome.set_result(result)
+            else:
+                self._outcome.set_exception(error)
+
+    def cancel(self):
+        with self._lock:
+            if not self._outcome.cancel():
+                return False
+            call = self._call
+        call.cancel()
+        return True
+
+    def cancelled(self):
+        return self._outcome.cancelled()
+
+    def running(self):
+        return not self._outcome.done()
+
+    def done(self):
+        return self._outcome.done()
+
+    def result(self, timeout=None):
+        try:
+            return self._outcome.result(timeout)
+        except futures.CancelledError:
+            raise grpc.FutureCancelledError()
+        except futures.TimeoutError:
+            raise grpc.FutureTimeoutError()
+
+    def exception(self, timeout=None):
+        try:
+            return self._outcome.exception(timeout)
+        except futures.CancelledError:
+            raise grpc.FutureCancelledError()
+        except futures.TimeoutError:
+            raise grpc.FutureTimeoutError()
+
+    def traceback(self, timeout=None):
+        error = self.exception(timeout)
+        return None if error is None else error.__traceback__
+
+    def add_done_callback(self, fn):
+        self._outcome.add_done_callback(lambda _: fn(self))
+
+    def is_active(self):
+        return self._call.is_active()
+
+    def time_remaining(self):
+        return self._call.time_remaining()
+
+    def add_callback(self, callback):
+        return self._call.add_callback(callback)
+
+    def initial_metadata(self):
+        return self._call.initial_metadata()
+
+    def trailing_metadata(self):
+        return self._call.trailing_metadata()
+
+    def code(self):
+        return self._call.code()
+
+    def details(self):
+        return self._call.details()
+
+
+def _is_transient_login_error(error):
+    """Returns true if a login that failed with error may succeed if sent
+    again."""
+    msg = str(error)
+    return (util.is_retriable_error(msg) or util.is_connection_error(msg) or
+            util._status_code(error) == grpc.StatusCode.UNAVAILABLE)
+
+
+def _round_robin(items):
+    """Returns a function giving the items in turn.
+
+    Most clients have a single stub, for which repeating it is cheaper than
+    cycling.
     """
+    if len(items) == 1:
+        return itertools.repeat(items[0]).__next__
+    return itertools.cycle(items).__next__
+
+
+class _DgraphClientBase(object):
+    """State and helpers that do no I/O, shared by DgraphClient and
+    AsyncDgraphClient."""
 
     def __init__(self, *clients):
         if not clients:
-            raise ValueError('No clients provided in DgraphClient constructor')
+            raise ValueError('No clients provided in {} constructor'.format(
+                type(self).__name__))
 
-        self._clients = clients[:]
+        self._clients = tuple(clients)
+        self._next_client = _round_robin(self._clients)
         self._jwt = api.Jwt()
-        self._login_metadata = []
+        self._login_metadata = ()
+        # Incremented on every login so that requests which saw the same
+        # expired token refresh it only once.
+        self._jwt_version = 0
+        self._jwt_refresh_at = None
+
+    def _set_jwt(self, response):
+        self._jwt = api.Jwt()
+        self._jwt.ParseFromString(response.json)
+        self._login_metadata = (("accessjwt", self._jwt.access_jwt),)
+        self._jwt_version += 1
+
+        # A token that is already due for refresh, for instance because of
+        # clock skew, is only refreshed once the server rejects it.
+        refresh_at = util.jwt_expiry(self._jwt.access_jwt)
+        if refresh_at is not None:
+            refresh_at -= _JWT_REFRESH_SKEW
+            if refresh_at <= time.time():
+                refresh_at = None
+        self._jwt_refresh_at = refresh_at
+
+    def any_client(self):
+        """Returns the gRPC clients in turn so that requests are distributed evenly among them."""
+        return self._next_client()
+
+    def _rpc(self, method):
+        """Returns the named method of the next client, in round-robin order.
+
+        The method is looked up on every call, so stub methods patched or
+        replaced after the first request are used.
+        """
+        return getattr(self._next_client(), method)
+
+    def add_login_metadata(self, metadata):
+        """Returns metadata with the login token added, as a tuple.
+
+        Without extra metadata the stored login tuple is returned as is, so
+        the common case does not allocate anything. It is rebuilt whenever
+        the token changes.
+        """
+        if not metadata:
+            return self._login_metadata
+        return self._login_metadata + tuple(metadata)
+
+
+class DgraphClient(_DgraphClientBase):
+    """Creates a new Client for interacting with the Dgraph store.
+
+    The client can be backed by multiple connections (to the same server, or
+    multiple servers in a cluster).
+    """
+
+    def __init__(self, *clients):
+        super(DgraphClient, self).__init__(*clients)
+        self._jwt_lock = threading.Lock()
 
     def check_version(self, timeout=None, metadata=None, credentials=None):
         """Returns the version of Dgraph if the server is ready to accept requests."""
+        return self._invoke(self._rpc('check_version'), _CHECK_REQ, timeout,
+                            metadata, credentials).tag
 
+    def warmup(self, timeout=None, metadata=None, credentials=None):
+        """Checks every client concurrently and returns their Dgraph versions.
+
+        Calling this at startup opens the connection of each client in
+        parallel instead of one by one on first use.
+        """
         new_metadata = self.add_login_metadata(metadata)
-        check_req = api.Check()
+        calls = [client.async_check_version(_CHECK_REQ, timeout=timeout,
+                                            metadata=new_metadata,
+                                            credentials=credentials)
+                 for client in self._clients]
+        return [call.result().tag for call in calls]
+
+    def pipeline(self, *calls, timeout=None, metadata=None, credentials=None):
+        """Sends independent requests concurrently and returns their responses.
+
+        Each call is a (method, request) pair, where method is 'alter',
+        'query' or 'check_version', for instance
+        ('query', pydgraph.Request(query=..., read_only=True)). All requests
+        are sent before waiting on any response, so the batch costs about
+        one round trip. Responses are returned in the order of calls.
+
+        Requests rejected because of an expired access JWT are sent again
+        together, once, after it is refreshed. Requests sent this way are not
+        part of any transaction. Errors of alter requests are raised as by
+        alter.
+        """
+        for method, _ in calls:
+            if method not in _PIPELINE_METHODS:
+                raise ValueError('pipeline cannot send {} requests'.format(method))
 
+        self._refresh_jwt_if_due()
+        jwt_version = self._jwt_version
+        sent = []
         try:
-            response = self.any_client().check_version(check_req, timeout=timeout,
-                                                       metadata=new_metadata,
-                                                       credentials=credentials)
-            return response.tag
-        except Exception as error:
-            if util.is_jwt_expired(error):
-                self.retry_login()
-                new_metadata = self.add_login_metadata(metadata)
-                response = self.any_client().check_version(check_req, timeout=timeout,
-                                                   metadata=new_metadata,
-                                                   credentials=credentials)
-                return response.tag
-            else:
-                raise error
+            new_metadata = self.add_login_metadata(metadata)
+            for method, req in calls:
+                sent.append(self._rpc('async_' + method)(
+                    req, timeout=timeout, metadata=new_metadata,
+                    credentials=credentials))
+
+            responses = [None] * len(calls)
+            expired = []
+            for i, call in enumerate(sent):
+                try:
+                    responses[i] = call.result()
+                except Exception as error:
+                    if util.is_jwt_expired(error):
+                        expired.append(i)
+                        continue
+                    if calls[i][0] == 'alter':
+                        _raise_mapped_alter_error(error)
+                    raise
+            if not expired:
+                return responses
+
+            self._retry_login_once(jwt_version)
+            new_metadata = self.add_login_metadata(metadata)
+            resent = []
+            for i in expired:
+                method, req = calls[i]
+                call = self._rpc('async_' + method)(
+                    req, timeout=timeout, metadata=new_metadata,
+                    credentials=credentials)
+                sent.append(call)
+                resent.append((i, call))
+            for i, call in resent:
+                try:
+                    responses[i] = call.result()
+                except Exception as error:
+                    if calls[i][0] == 'alter':
+                        _raise_mapped_alter_error(error)
+                    raise
+            return responses
+        except Exception:
+            for call in sent:
+                call.cancel()
+            raise
 
     def login(self, userid, password, timeout=None, metadata=None,
               credentials=None):
-        login_req = api.LoginRequest()
-        login_req.userid = userid
-        login_req.password = password
-        login_req.namespace = 0
-
-        response = self.any_client().login(login_req, timeout=timeout,
-                                           metadata=metadata,
-                                           credentials=credentials)
-        self._jwt = api.Jwt()
-        self._jwt.ParseFromString(response.json)
-        self._login_metadata = [("accessjwt", self._jwt.access_jwt)]
+        return self.login_into_namespace(userid, password, 0, timeout=timeout,
+                                         metadata=metadata,
+                                         credentials=credentials)
 
     def login_into_namespace(self, userid, password, namespace, timeout=None, metadata=None,
               credentials=None):
@@ -84,12 +334,10 @@ class DgraphClient(object):
         login_req.password = password
         login_req.namespace = namespace
 
-        response = self.any_client().login(login_req, timeout=timeout,
-                                           metadata=metadata,
-                                           credentials=credentials)
-        self._jwt = api.Jwt()
-        self._jwt.ParseFromString(response.json)
-        self._login_metadata = [("accessjwt", self._jwt.access_jwt)]
+        response = self._rpc('login')(login_req, timeout=timeout,
+                                      metadata=metadata,
+                                      credentials=credentials)
+        self._set_jwt(response)
 
     def retry_login(self, timeout=None, metadata=None, credentials=None):
         if len(self._jwt.refresh_jwt) == 0:
@@ -98,69 +346,142 @@ class DgraphClient(object):
         login_req = api.LoginRequest()
         login_req.refresh_token = self._jwt.refresh_jwt
 
-        response = self.any_client().login(login_req, timeout=timeout,
-                                           metadata=metadata,
-                                           credentials=credentials)
-        self._jwt = api.Jwt()
-        self._jwt.ParseFromString(response.json)
-        self._login_metadata = [("accessjwt", self._jwt.access_jwt)]
+        # Transient errors are retried with a jittered exponential backoff
+        # so a flapping server does not fail every request that needs a
+        # fresh token.
+        for attempt in range(_LOGIN_RETRIES):
+            try:
+                response = self._rpc('login')(login_req, timeout=timeout,
+                                              metadata=metadata,
+                                              credentials=credentials)
+                break
+            except Exception as error:
+                if (attempt == _LOGIN_RETRIES - 1 or
+                        not _is_transient_login_error(error)):
+                    raise error
+                time.sleep(min(2 ** attempt, 5) + random.random() * 0.25)
 
-    def alter(self, operation, timeout=None, metadata=None, credentials=None):
-        """Runs a modification via this client."""
-        new_metadata = self.add_login_metadata(metadata)
+        self._set_jwt(response)
+
+    def _invoke(self, rpc, req, timeout, metadata, credentials):
+        """Sends req with the stub method rpc and the login metadata.
 
+        If the access JWT has expired, it is refreshed and the request is
+        sent once more. Transactions send their requests through here too.
+        """
+        self._refresh_jwt_if_due()
+        jwt_version = self._jwt_version
         try:
-            return self.any_client().alter(operation, timeout=timeout,
-                                           metadata=new_metadata,
-                                           credentials=credentials)
+            return rpc(req, timeout=timeout,
+                       metadata=self.add_login_metadata(metadata),
+                       credentials=credentials)
         except Exception as error:
-            if util.is_jwt_expired(error):
-                self.retry_login()
-                new_metadata = self.add_login_metadata(metadata)
-                try:
-                    return self.any_client().alter(operation, timeout=timeout,
-                                                   metadata=new_metadata,
-                                                   credentials=credentials)
-                except Exception as error:
-                    self._common_except_alter(error)
-            else:
-                self._common_except_alter(error)
+            if not util.is_jwt_expired(error):
+                raise
+            self._retry_login_once(jwt_version)
+            return rpc(req, timeout=timeout,
+                       metadata=self.add_login_metadata(metadata),
+                       credentials=credentials)
 
-    @staticmethod
-    def _common_except_alter(error):
-        if util.is_retriable_error(error):
-            raise errors.RetriableError(error)
+    def _refresh_jwt_if_due(self):
+        """Refreshes the access JWT if it is about to expire.
 
-        if util.is_connection_error(error):
-            raise errors.ConnectionError(error)
+        This saves a round trip per request that would otherwise be rejected
+        with an expired token; such errors are still retried as a fallback.
+        """
+        refresh_at = self._jwt_refresh_at
+        if refresh_at is not None and time.time() >= refresh_at:
+            try:
+                self._retry_login_once(self._jwt_version)
+            except Exception:
+                # The current token is still valid for a few seconds, so the
+                # request is sent with it. Early refreshes stop until the
+                # next login; an expired token is still refreshed on
+                # rejection.
+                self._jwt_refresh_at = None
 
-        raise error
+    def _retry_login_once(self, jwt_version):
+        """Refreshes the JWT unless it changed since jwt_version was read.
+
+        When many requests fail with the same expired token at once, only
+        the first one to get here sends a login request; the others wait
+        for it and then use the new token.
+        """
+        with self._jwt_lock:
+            if self._jwt_version == jwt_version:
+                self.retry_login()
+
+    def alter(self, operation, timeout=None, metadata=None, credentials=None):
+        """Runs a modification via this client."""
+        try:
+            return self._invoke(self._rpc('alter'), operation,
+                                timeout, metadata, credentials)
+        except Exception as error:
+            _raise_mapped_alter_error(error)
 
     def async_alter(self, operation, timeout=None, metadata=None, credentials=None):
-        """The async version of alter."""
-        new_metadata = self.add_login_metadata(metadata)
-        return self.any_client().async_alter(operation, timeout=timeout,
-                                             metadata=new_metadata,
-                                             credentials=credentials)
+        """The async version of alter.
+
+        Returns a gRPC future. If the access JWT has expired, it is refreshed
+        on a background thread and the operation is sent again before the
+        future completes. Unlike alter, the JWT is not refreshed ahead of
+        its expiry, so that the caller is never blocked by a login request.
+        """
+        jwt_version = self._jwt_version
+
+        def send():
+            return self._rpc('async_alter')(
+                operation, timeout=timeout,
+                metadata=self.add_login_metadata(metadata),
+                credentials=credentials)
+
+        def retry():
+            try:
+                self._retry_login_once(jwt_version)
+                call = send()
+            except Exception as error:
+                result._finish(error=error)
+                return
+            result._set_call(call)
+            call.add_done_callback(finish)
+
+        def finish(call):
+            try:
+                result._finish(call.result())
+            except Exception as error:
+                result._finish(error=error)
+
+        def done(call):
+            try:
+                result._finish(call.result())
+            except Exception as error:
+                if not util.is_jwt_expired(error) or result.cancelled():
+                    result._finish(error=error)
+                    return
+                # Done callbacks run on a gRPC thread, which must not block
+                # on the login request.
+                threading.Thread(target=retry, daemon=True).start()
+
+        result = _AlterFuture(send())
+        result._call.add_done_callback(done)
+        return result
 
     @staticmethod
     def handle_alter_future(future):
         try:
             return future.result()
         except Exception as error:
-            DgraphClient._common_except_alter(error)
+            _raise_mapped_alter_error(error)
+
+    def close(self):
+        """Closes all the client stubs of this client.
+
+        Closing a sync channel does not wait on the network, so the stubs
+        are simply closed one after another.
+        """
+        for client in self._clients:
+            client.close()
 
     def txn(self, read_only=False, best_effort=False):
         """Creates a transaction."""
         return txn.Txn(self, read_only=read_only, best_effort=best_effort)
-
-    def any_client(self):
-        """Returns a random gRPC client so that requests are distributed evenly among them."""
-        return random.choice(self._clients)
-
-    def add_login_metadata(self, metadata):
-        new_metadata = list(self._login_metadata)
-        if not metadata:
-            return new_metadata
-        new_metadata.extend(metadata)
-        return new_metadata
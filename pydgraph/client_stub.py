@@ -14,86 +14,332 @@
 
 """Stub for RPC request."""
 
+import collections
+import functools
+import itertools
+import os
+import re
+import threading
+import weakref
+
 import grpc
 
 from pydgraph.meta import VERSION
 from pydgraph.proto import api_pb2_grpc as api_grpc
 
-try:
-    from urllib.parse import urlparse
-except ImportError:
-     from urlparse import urlparse
-
 __author__ = 'Garvit Pahal'
 __maintainer__ = 'Dgraph Labs <contact@dgraph.io>' 
 __version__ = VERSION
 __status__ = 'development'
 
+# HTTP/2 keepalive settings applied to every channel unless the caller sets
+# them. Pings are only sent while calls are in flight and no more often than
+# every five minutes, which is what a Go gRPC server (such as Dgraph Alpha)
+# accepts by default without closing the connection.
+_KEEPALIVE_OPTIONS = (
+    ('grpc.keepalive_time_ms', 300000),
+    ('grpc.keepalive_timeout_ms', 20000),
+    ('grpc.keepalive_permit_without_calls', 0),
+    ('grpc.http2.max_pings_without_data', 0),
+)
+
+
+# Host part of a cloud endpoint: everything after an optional http(s) scheme
+# up to the port or path.
+_CLOUD_HOST_RE = re.compile(r'^(?:https?://)?([^:/]+)')
+
+
+def _merge_options(options, defaults):
+    """Returns the channel options with defaults added for any unset keys."""
+    merged = dict(defaults)
+    merged.update(options or ())
+    return list(merged.items())
+
+
+@functools.lru_cache(maxsize=1)
+def _root_ssl_credentials():
+    """Returns SSL credentials using the default root certificates.
+
+    Building them reads and parses the CA bundle, so it is only done once.
+    """
+    return grpc.ssl_channel_credentials()
+
+
+class _CallDetails(collections.namedtuple(
+        '_CallDetails', ('method', 'timeout', 'metadata', 'credentials',
+                         'wait_for_ready', 'compression')),
+                   grpc.ClientCallDetails):
+    pass
+
+
+class _StaticMetadataInterceptor(grpc.UnaryUnaryClientInterceptor):
+    """Client interceptor adding fixed metadata to every call.
+
+    Unlike call credentials plugins, which gRPC runs on a new Python thread
+    for each call, this runs inline on the calling thread.
+    """
+
+    __slots__ = ('_metadata',)
+
+    def __init__(self, metadata):
+        self._metadata = tuple(metadata)
+
+    def intercept_unary_unary(self, continuation, details, request):
+        metadata = self._metadata
+        if details.metadata:
+            metadata = tuple(details.metadata) + metadata
+        return continuation(_CallDetails(
+            details.method, details.timeout, metadata, details.credentials,
+            details.wait_for_ready, details.compression), request)
+
+
+def _rpc_picker(stubs, method):
+    """Returns a function giving the method callable of each stub in turn.
+
+    The callables are looked up once, so each RPC only pays for a C-level
+    next() instead of resolving the stub and its method on every call.
+    """
+    methods = [getattr(stub, method) for stub in stubs]
+    if len(methods) == 1:
+        # Without a pool, repeating the one callable is cheaper than cycling.
+        return itertools.repeat(methods[0]).__next__
+    return itertools.cycle(methods).__next__
+
+
+def _make_rpc(name, picker, doc, future=False):
+    """Returns a DgraphClientStub method sending a request with the callable
+    given by the picker attribute, or its future variant.
+
+    All RPC methods share this code object. Arguments are passed on
+    positionally, matching grpc's UnaryUnaryMultiCallable, so no kwargs dict
+    is built per call.
+    """
+    if future:
+        def rpc(self, req, timeout=None, metadata=None, credentials=None):
+            return getattr(self, picker)().future(req, timeout, metadata,
+                                                  credentials,
+                                                  self._wait_for_ready)
+    else:
+        def rpc(self, req, timeout=None, metadata=None, credentials=None):
+            return getattr(self, picker)()(req, timeout, metadata, credentials,
+                                           self._wait_for_ready)
+    rpc.__name__ = name
+    rpc.__qualname__ = 'DgraphClientStub.' + name
+    rpc.__doc__ = doc
+    return rpc
+
+
+# Attribute holding the picker of each RPC method on DgraphClientStub.
+_RPC_PICKERS = (
+    ('_login', 'Login'),
+    ('_alter', 'Alter'),
+    ('_query', 'Query'),
+    ('_commit_or_abort', 'CommitOrAbort'),
+    ('_check_version', 'CheckVersion'),
+)
+
+# Stubs that opened their own channels. gRPC channels cannot be used across
+# os.fork(), so these are reconnected the next time they are used in a child.
+_connected_stubs = weakref.WeakSet()
+
+
+def _reconnect_after_fork():
+    for stub in list(_connected_stubs):
+        stub._reconnect_on_next_call()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reconnect_after_fork)
+
 
 class DgraphClientStub(object):
-    """Stub for the Dgraph grpc client."""
+    """Stub for the Dgraph grpc client.
+
+    An existing grpc channel can be passed in to share one connection between
+    several stubs. Such a channel is owned by the caller and is not closed by
+    close().
+
+    A single HTTP/2 connection only carries a limited number of concurrent
+    streams (usually 100). Setting pool_size opens that many channels to addr,
+    each with its own connection, and spreads requests across them in
+    round-robin order. As a rule of thumb, use one channel per 100 requests
+    expected to be in flight at the same time.
+
+    Channels are created with HTTP/2 keepalive enabled so broken connections
+    are detected during long requests. Pass disable_keepalive=True if the
+    network in between does not allow pings.
+
+    With wait_for_ready=True, requests sent while the connection is down
+    wait for it to come back (up to their timeout) instead of failing
+    straight away with UNAVAILABLE.
+
+    interceptors are gRPC client interceptors applied to every channel
+    created by the stub.
+
+    compression sets the default compression (such as grpc.Compression.Gzip)
+    of requests sent over channels created by the stub. It shrinks large
+    schema and mutation payloads at the cost of CPU time on both ends.
+
+    If the process forks, channels created by the stub are reopened in the
+    child the first time it is used there.
+    """
+
+    def __init__(self, addr='localhost:9080', credentials=None, options=None,
+                 channel=None, pool_size=1, disable_keepalive=False,
+                 compression=None, interceptors=None, wait_for_ready=None):
+        if pool_size < 1:
+            raise ValueError('pool_size must be at least 1')
+
+        self._closed = False
+        self._wait_for_ready = wait_for_ready
+        if channel is not None:
+            if pool_size != 1:
+                raise ValueError('pool_size cannot be used with an existing channel')
+            if compression is not None or interceptors:
+                raise ValueError('compression and interceptors cannot be used '
+                                 'with an existing channel')
+            self._owns_channel = False
+            self._bind_channels([channel])
+            return
+
+        if not disable_keepalive:
+            options = _merge_options(options, _KEEPALIVE_OPTIONS)
+        if pool_size > 1:
+            # Channels with the same arguments share their connections
+            # through the global subchannel pool. A local pool gives each
+            # channel a connection of its own.
+            options = list(options or []) + [('grpc.use_local_subchannel_pool', 1)]
+        self._owns_channel = True
+        self._target = (addr, credentials, options, compression,
+                        tuple(interceptors or ()), pool_size)
+        self._connect()
+        _connected_stubs.add(self)
+
+    def _connect(self):
+        (addr, credentials, options, compression, interceptors,
+         pool_size) = self._target
+        self._bind_channels([self._create_channel(addr, credentials, options,
+                                                  compression, interceptors)
+                             for _ in range(pool_size)])
+
+    def _bind_channels(self, channels):
+        self._channels = channels
+        self._stubs = [api_grpc.DgraphStub(c) for c in channels]
+        for attr, method in _RPC_PICKERS:
+            setattr(self, attr, _rpc_picker(self._stubs, method))
+        self.channel = channels[0]
+        self.stub = self._stubs[0]
+
+    def _reconnect_on_next_call(self):
+        """Replaces the RPC pickers so the first call reopens the channels.
+
+        This keeps the fork check off the path of every other request.
+        """
+        if self._closed:
+            return
 
-    def __init__(self, addr='localhost:9080', credentials=None, options=None):
+        lock = threading.Lock()
+        stale = self._channels
+
+        def reconnect(attr):
+            def pick():
+                # Threads making their first calls at the same time must not
+                # each open a pool of channels.
+                with lock:
+                    if self._channels is stale:
+                        self._connect()
+                return getattr(self, attr)()
+            return pick
+
+        for attr, _ in _RPC_PICKERS:
+            setattr(self, attr, reconnect(attr))
+
+    @staticmethod
+    def _create_channel(addr, credentials, options, compression=None,
+                        interceptors=()):
         if credentials is None:
-            self.channel = grpc.insecure_channel(addr, options)
+            channel = grpc.insecure_channel(addr, options, compression)
         else:
-            self.channel = grpc.secure_channel(addr, credentials, options)
-
-        self.stub = api_grpc.DgraphStub(self.channel)
-
-    def login(self, login_req, timeout=None, metadata=None, credentials=None):
-        return self.stub.Login(login_req, timeout=timeout, metadata=metadata,
-                               credentials=credentials)
-
-    def alter(self, operation, timeout=None, metadata=None, credentials=None):
-        """Runs alter operation."""
-        return self.stub.Alter(operation, timeout=timeout, metadata=metadata,
-                               credentials=credentials)
-
-    def async_alter(self, operation, timeout=None, metadata=None, credentials=None):
-        """Async version of alter."""
-        return self.stub.Alter.future(operation, timeout=timeout, metadata=metadata,
-                                      credentials=credentials)
-
-    def query(self, req, timeout=None, metadata=None, credentials=None):
-        """Runs query or mutate operation."""
-        return self.stub.Query(req, timeout=timeout, metadata=metadata,
-                               credentials=credentials)
-
-    def async_query(self, req, timeout=None, metadata=None, credentials=None):
-        """Async version of query."""
-        return self.stub.Query.future(req, timeout=timeout, metadata=metadata,
-                                      credentials=credentials)
-
-    def commit_or_abort(self, ctx, timeout=None, metadata=None,
-                        credentials=None):
-        """Runs commit or abort operation."""
-        return self.stub.CommitOrAbort(ctx, timeout=timeout, metadata=metadata,
-                                       credentials=credentials)
-
-    def check_version(self, check, timeout=None, metadata=None,
-                      credentials=None):
-        """Returns the version of the Dgraph instance."""
-        return self.stub.CheckVersion(check, timeout=timeout,
-                                      metadata=metadata,
-                                      credentials=credentials)
+            channel = grpc.secure_channel(addr, credentials, options,
+                                          compression)
+        if interceptors:
+            channel = grpc.intercept_channel(channel, *interceptors)
+        return channel
 
-    def close(self):
-        """Deletes channel and stub."""
+    login = _make_rpc('login', '_login', 'Logs in to the Dgraph instance.')
+    async_login = _make_rpc('async_login', '_login', 'Async version of login.',
+                            future=True)
+    alter = _make_rpc('alter', '_alter', 'Runs alter operation.')
+    async_alter = _make_rpc('async_alter', '_alter', 'Async version of alter.',
+                            future=True)
+    query = _make_rpc('query', '_query', 'Runs query or mutate operation.')
+    async_query = _make_rpc('async_query', '_query', 'Async version of query.',
+                            future=True)
+    commit_or_abort = _make_rpc('commit_or_abort', '_commit_or_abort',
+                                'Runs commit or abort operation.')
+    async_commit_or_abort = _make_rpc('async_commit_or_abort',
+                                      '_commit_or_abort',
+                                      'Async version of commit_or_abort.',
+                                      future=True)
+    check_version = _make_rpc('check_version', '_check_version',
+                              'Returns the version of the Dgraph instance.')
+    async_check_version = _make_rpc('async_check_version', '_check_version',
+                                    'Async version of check_version.',
+                                    future=True)
+
+    def query_many(self, reqs, timeout=None, metadata=None, credentials=None):
+        """Runs several query or mutate operations concurrently.
+
+        All requests are sent before waiting on any response, so a batch
+        costs roughly one round trip instead of one per request. Responses
+        are returned in the order of reqs.
+        """
+        futures = [self._query().future(req, timeout, metadata, credentials,
+                                        self._wait_for_ready)
+                   for req in reqs]
         try:
-            self.channel.close()
-        except:
-            pass
+            return [future.result() for future in futures]
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Deletes channel and stub. The channel is only closed if it was
+        created by this stub. Closing a stub more than once is a no-op."""
+        if self._closed:
+            return
+        self._closed = True
+        _connected_stubs.discard(self)
+
+        if self._owns_channel:
+            for channel in self._channels:
+                try:
+                    channel.close()
+                except:
+                    pass
         del self.channel
         del self.stub
 
     @staticmethod
     def parse_host(cloud_endpoint):
         """Converts any cloud endpoint to grpc endpoint"""
-        host = cloud_endpoint
-        if cloud_endpoint.startswith("http"): # catch http:// and https://
-            host = urlparse(cloud_endpoint).netloc
-        host = host.split(":",1)[0] # remove port if any
+        match = _CLOUD_HOST_RE.match(cloud_endpoint)
+        if match is not None:
+            host = match.group(1)
+        else:
+            host = cloud_endpoint
+            if cloud_endpoint.startswith("http"): # catch http:// and https://
+                # Only imported on this rarely taken path.
+                from urllib.parse import urlparse
+                host = urlparse(cloud_endpoint).netloc
+            host = host.split(":",1)[0] # remove port if any
         if not ".grpc." in host:
             url_parts = host.split(".", 1)
             host = url_parts[0] + ".grpc." + url_parts[1]
@@ -108,15 +354,11 @@ class DgraphClientStub(object):
     def from_cloud(cloud_endpoint, api_key, options=None):
         """Returns Dgraph Client stub for the Dgraph Cloud endpoint"""
         host = DgraphClientStub.parse_host(cloud_endpoint)
-        creds = grpc.ssl_channel_credentials()
-        call_credentials = grpc.metadata_call_credentials(
-            lambda context, callback: callback((("authorization", api_key),), None))
-        composite_credentials = grpc.composite_channel_credentials(
-            creds, call_credentials)
-        if options==None:
-            options=[('grpc.enable_http_proxy', 0)]
-        else:
-            options.append(('grpc.enable_http_proxy', 0))
+        options = _merge_options(options, (('grpc.enable_http_proxy', 0),))
+        # The API key is attached by an interceptor rather than call
+        # credentials, which would start a thread for every request.
+        auth = _StaticMetadataInterceptor((('authorization', api_key),))
         client_stub = DgraphClientStub('{host}:{port}'.format(
-            host=host, port="443"), composite_credentials, options=options)
+            host=host, port="443"), _root_ssl_credentials(), options=options,
+            interceptors=[auth])
         return client_stub
@@ -14,7 +14,6 @@
 
 """Dgraph atomic transaction support."""
 
-import json
 import grpc
 
 from pydgraph import errors, util
@@ -26,21 +25,32 @@ __maintainer__ = 'Dgraph Labs <contact@dgraph.io>'
 __version__ = VERSION
 __status__ = 'development'
 
+# Request.RespFormat value of each resp_format accepted by Txn.query. Both
+# spellings are listed so a lookup needs no upper() call.
+_RESP_FORMATS = {
+    'JSON': api.Request.RespFormat.JSON,
+    'RDF': api.Request.RespFormat.RDF,
+    'json': api.Request.RespFormat.JSON,
+    'rdf': api.Request.RespFormat.RDF,
+}
 
-class Txn(object):
-    """Txn is a single atomic transaction.
 
-    A transaction lifecycle is as follows:
+def _encode_nquads(nquads):
+    """Encodes N-Quads given as a string or an iterable of lines.
 
-    1. Created using Client.newTxn.
+    Lines are joined with newlines into a single payload, so many N-Quads
+    can be sent in one mutation.
+    """
+    if isinstance(nquads, str):
+        return nquads.encode('utf8')
+    if isinstance(nquads, bytes):
+        return nquads
+    return b'\n'.join(line.encode('utf8') if isinstance(line, str) else line
+                      for line in nquads)
 
-    2. Modified via calls to query and mutate.
 
-    3. Committed or discarded. If any mutations have been made, it's important
-    that at least one of these methods is called to clean up resources. Discard
-    is a no-op if commit has already been called, so it's safe to call discard
-    after calling commit.
-    """
+class _TxnBase(object):
+    """State and request building shared by Txn and AsyncTxn."""
 
     def __init__(self, client, read_only=False, best_effort=False):
         if not read_only and best_effort:
@@ -56,6 +66,154 @@ class Txn(object):
         self._read_only = read_only
         self._best_effort = best_effort
 
+    def create_mutation(self, mutation=None, set_obj=None, del_obj=None,
+                        set_nquads=None, del_nquads=None, cond=None):
+        if not mutation:
+            mutation = api.Mutation()
+        if set_obj:
+            mutation.set_json = util.json_dumps(set_obj)
+        if del_obj:
+            mutation.delete_json = util.json_dumps(del_obj)
+        if set_nquads:
+            mutation.set_nquads = _encode_nquads(set_nquads)
+        if del_nquads:
+            mutation.del_nquads = _encode_nquads(del_nquads)
+        if cond:
+            mutation.cond = cond
+        return mutation
+
+    def create_request(self, query=None, variables=None, mutations=None, commit_now=None, resp_format="JSON"):
+        """Creates a request object"""
+        try:
+            resp_format = _RESP_FORMATS[resp_format]
+        except KeyError:
+            raise errors.TransactionError(
+                'Response format should be either RDF or JSON') from None
+
+        # Only fields differing from their defaults are set. Plain
+        # assignments are cheaper than passing every field to the
+        # constructor as keyword arguments.
+        request = api.Request()
+        if self._ctx.start_ts:
+            request.start_ts = self._ctx.start_ts
+        if commit_now:
+            request.commit_now = True
+        if self._read_only:
+            request.read_only = True
+        if self._best_effort:
+            request.best_effort = True
+        if resp_format:
+            request.resp_format = resp_format
+
+        if variables is not None:
+            request_vars = request.vars
+            for key, value in variables.items():
+                if isinstance(key, str) and isinstance(value, str):
+                    request_vars[key] = value
+                else:
+                    raise errors.TransactionError('Values and keys in variable map must be strings')
+        if query:
+            # query is a proto string field, so it is assigned as is rather
+            # than encoded to bytes for protobuf to decode again.
+            request.query = query
+        if mutations:
+            request.mutations.extend(mutations)
+        return request
+
+    def _common_request(self, request):
+        if self._finished:
+            raise errors.TransactionError('Transaction has already been committed or discarded')
+
+        if len(request.mutations) > 0:
+            if self._read_only:
+                raise errors.TransactionError('Readonly transaction cannot run mutations')
+            self._mutated = True
+
+        request.hash = self._ctx.hash
+
+    @staticmethod
+    def _common_except_mutate(error):
+        if util.is_aborted_error(error):
+            raise errors.AbortedError()
+
+        # Formatting a gRPC error is not cheap, so the message is built once
+        # and matched by both checks below.
+        msg = str(error)
+        if util.is_retriable_error(msg):
+            raise errors.RetriableError(error)
+
+        if util.is_connection_error(msg):
+            raise errors.ConnectionError(error)
+
+        raise error
+
+    def _common_commit(self):
+        if self._read_only:
+            raise errors.TransactionError(
+                'Readonly transaction cannot run mutations or be committed')
+        if self._finished:
+            raise errors.TransactionError(
+                'Transaction has already been committed or discarded')
+
+        self._finished = True
+        return self._mutated
+
+    @staticmethod
+    def _common_except_commit(error):
+        if util.is_aborted_error(error):
+            raise errors.AbortedError()
+
+        raise error
+
+    def _common_discard(self):
+        if self._finished:
+            return False
+
+        self._finished = True
+        if not self._mutated:
+            return False
+
+        self._ctx.aborted = True
+        return True
+
+    def merge_context(self, src=None):
+        """Merges context from this instance with src."""
+        if src is None:
+            # This condition will be true only if the server doesn't return a
+            # txn context after a query or mutation.
+            return
+
+        ctx = self._ctx
+        start_ts = src.start_ts
+        if ctx.start_ts == 0:
+            ctx.start_ts = start_ts
+        elif ctx.start_ts != start_ts:
+            # This condition should never be true.
+            raise errors.TransactionError('StartTs mismatch')
+        ctx.hash = src.hash
+        # Queries return no keys or predicates, so skip extending with
+        # empty lists.
+        if src.keys:
+            ctx.keys.extend(src.keys)
+        if src.preds:
+            ctx.preds.extend(src.preds)
+
+
+class Txn(_TxnBase):
+    """Txn is a single atomic transaction.
+
+    A transaction lifecycle is as follows:
+
+    1. Created using Client.newTxn.
+
+    2. Modified via calls to query and mutate.
+
+    3. Committed or discarded. If any mutations have been made, it's important
+    that at least one of these methods is called to clean up resources. Discard
+    is a no-op if commit has already been called, so it's safe to call discard
+    after calling commit.
+    """
+
     def query(self, query, variables=None, timeout=None, metadata=None, credentials=None, resp_format="JSON"):
         """Executes a query operation."""
         req = self.create_request(query=query, variables=variables, resp_format=resp_format)
@@ -72,7 +230,8 @@ class Txn(object):
         """Executes a mutate operation."""
         mutation = self.create_mutation(mutation, set_obj, del_obj, set_nquads, del_nquads, cond)
         commit_now = commit_now or mutation.commit_now
-        req = self.create_request(mutations=[mutation], commit_now=commit_now)
+        req = self.create_request(commit_now=commit_now)
+        req.mutations.append(mutation)
         return self.do_request(req, timeout=timeout, metadata=metadata, credentials=credentials)
 
     def async_mutate(self, mutation=None, set_obj=None, del_obj=None,
@@ -81,41 +240,18 @@ class Txn(object):
         """Async version of mutate."""
         mutation = self.create_mutation(mutation, set_obj, del_obj, set_nquads, del_nquads, cond)
         commit_now = commit_now or mutation.commit_now
-        req = self.create_request(mutations=[mutation], commit_now=commit_now)
+        req = self.create_request(commit_now=commit_now)
+        req.mutations.append(mutation)
         return self.async_do_request(req, timeout=timeout, metadata=metadata,
                                      credentials=credentials)
 
     def do_request(self, request, timeout=None, metadata=None, credentials=None):
         """Executes a query/mutate operation on the server."""
-        if self._finished:
-            raise errors.TransactionError('Transaction has already been committed or discarded')
-
-        if len(request.mutations) > 0:
-            if self._read_only:
-                raise errors.TransactionError('Readonly transaction cannot run mutations')
-            self._mutated = True
-
-        request.hash = self._ctx.hash
-        new_metadata = self._dg.add_login_metadata(metadata)
-        query_error = None
+        self._common_request(request)
         try:
-            response = self._dc.query(request, timeout=timeout,
-                                      metadata=new_metadata,
-                                      credentials=credentials)
+            response = self._dg._invoke(self._dc.query, request, timeout,
+                                        metadata, credentials)
         except Exception as error:
-            if util.is_jwt_expired(error):
-                self._dg.retry_login()
-                new_metadata = self._dg.add_login_metadata(metadata)
-                try:
-                    response = self._dc.query(request, timeout=timeout,
-                                              metadata=new_metadata,
-                                              credentials=credentials)
-                except Exception as error:
-                    query_error = error
-            else:
-                query_error = error
-
-        if query_error is not None:
             try:
                 self.discard(timeout=timeout, metadata=metadata,
                              credentials=credentials)
@@ -123,7 +259,7 @@ class Txn(object):
                 # Ignore error - user should see the original error.
                 pass
 
-            self._common_except_mutate(query_error)
+            self._common_except_mutate(error)
 
         if request.commit_now:
             self._finished = True
@@ -156,7 +292,6 @@ class Txn(object):
 
         return response
 
-
     @staticmethod
     def handle_mutate_future(txn, future, commit_now):
         """Method to call when getting the result of a future returned by async_mutate"""
@@ -176,145 +311,61 @@ class Txn(object):
         txn.merge_context(response.txn)
         return response
 
-    def create_mutation(self, mutation=None, set_obj=None, del_obj=None,
-                        set_nquads=None, del_nquads=None, cond=None):
-        if not mutation:
-            mutation = api.Mutation()
-        if set_obj:
-            mutation.set_json = json.dumps(set_obj).encode('utf8')
-        if del_obj:
-            mutation.delete_json = json.dumps(del_obj).encode('utf8')
-        if set_nquads:
-            mutation.set_nquads = set_nquads.encode('utf8')
-        if del_nquads:
-            mutation.del_nquads = del_nquads.encode('utf8')
-        if cond:
-            mutation.cond = cond.encode('utf8')
-        return mutation
-
-    def create_request(self, query=None, variables=None, mutations=None, commit_now=None, resp_format="JSON"):
-        if resp_format=="JSON":
-            resp_format = api.Request.RespFormat.JSON
-        elif resp_format =="RDF":
-            resp_format = api.Request.RespFormat.RDF
-        else: raise errors.TransactionError('Response format should be either RDF or JSON')
-
-        """Creates a request object"""
-        request = api.Request(start_ts = self._ctx.start_ts, commit_now=commit_now,
-                              read_only=self._read_only, best_effort=self._best_effort, resp_format = resp_format)
-
-        if variables is not None:
-            for key, value in variables.items():
-                if util.is_string(key) and util.is_string(value):
-                    request.vars[key] = value
-                else:
-                    raise errors.TransactionError('Values and keys in variable map must be strings')
-        if query:
-            request.query = query.encode('utf8')
-        if mutations:
-            request.mutations.extend(mutations)
-        return request
-
-    @staticmethod
-    def _common_except_mutate(error):
-        if util.is_aborted_error(error):
-            raise errors.AbortedError()
-
-        if util.is_retriable_error(error):
-            raise errors.RetriableError(error)
-
-        if util.is_connection_error(error):
-            raise errors.ConnectionError(error)
-
-        raise error
-
     def commit(self, timeout=None, metadata=None, credentials=None):
         """Commits the transaction."""
         if not self._common_commit():
             return
 
-        new_metadata = self._dg.add_login_metadata(metadata)
         try:
-            return self._dc.commit_or_abort(self._ctx, timeout=timeout,
-                                     metadata=new_metadata,
-                                     credentials=credentials)
+            return self._dg._invoke(self._dc.commit_or_abort, self._ctx,
+                                    timeout, metadata, credentials)
         except Exception as error:
-            if util.is_jwt_expired(error):
-                self._dg.retry_login()
-                new_metadata = self._dg.add_login_metadata(metadata)
-                try:
-                    self._dc.commit_or_abort(self._ctx, timeout=timeout,
-                                             metadata=new_metadata,
-                                             credentials=credentials)
-                except Exception as error:
-                    return self._common_except_commit(error)
-
             self._common_except_commit(error)
 
-    def _common_commit(self):
-        if self._read_only:
-            raise errors.TransactionError(
-                'Readonly transaction cannot run mutations or be committed')
-        if self._finished:
-            raise errors.TransactionError(
-                'Transaction has already been committed or discarded')
+    def async_commit(self, timeout=None, metadata=None, credentials=None):
+        """Async version of commit.
 
-        self._finished = True
-        return self._mutated
+        Returns a future, or None if the transaction made no mutations and
+        there is nothing to commit.
+        """
+        if not self._common_commit():
+            return None
 
-    @staticmethod
-    def _common_except_commit(error):
-        if util.is_aborted_error(error):
-            raise errors.AbortedError()
+        new_metadata = self._dg.add_login_metadata(metadata)
+        return self._dc.async_commit_or_abort(self._ctx, timeout=timeout,
+                                              metadata=new_metadata,
+                                              credentials=credentials)
 
-        raise error
+    @staticmethod
+    def handle_commit_future(future):
+        """Method to call when getting the result of a future returned by async_commit"""
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except Exception as error:
+            Txn._common_except_commit(error)
 
     def discard(self, timeout=None, metadata=None, credentials=None):
         """Discards the transaction."""
         if not self._common_discard():
             return
 
-        new_metadata = self._dg.add_login_metadata(metadata)
-        try:
-            self._dc.commit_or_abort(self._ctx, timeout=timeout,
-                                     metadata=new_metadata,
-                                     credentials=credentials)
-        except Exception as error:
-            if util.is_jwt_expired(error):
-                self._dg.retry_login()
-                new_metadata = self._dg.add_login_metadata(metadata)
-                self._dc.commit_or_abort(self._ctx, timeout=timeout,
-                                         metadata=new_metadata,
-                                         credentials=credentials)
-            else:
-                raise error
-
-    def _common_discard(self):
-        if self._finished:
-            return False
-
-        self._finished = True
-        if not self._mutated:
-            return False
-
-        self._ctx.aborted = True
-        return True
+        self._dg._invoke(self._dc.commit_or_abort, self._ctx, timeout,
+                         metadata, credentials)
 
-    def merge_context(self, src=None):
-        """Merges context from this instance with src."""
-        if src is None:
-            # This condition will be true only if the server doesn't return a
-            # txn context after a query or mutation.
-            return
+    def __enter__(self):
+        return self
 
-        if self._ctx.start_ts == 0:
-            self._ctx.start_ts = src.start_ts
-        elif self._ctx.start_ts != src.start_ts:
-            # This condition should never be true.
-            raise errors.TransactionError('StartTs mismatch')
-        self._ctx.hash = src.hash
-        self._ctx.keys.extend(src.keys)
-        self._ctx.preds.extend(src.preds)
+    def __exit__(self, exc_type, exc_value, traceback):
+        # discard returns before building any request when the transaction
+        # is finished or never mutated, so read-only use costs nothing here.
+        try:
+            self.discard()
+        except:
+            if exc_type is None:
+                raise
+            # Ignore error - user should see the original error.
 
     def retry_login(self):
         self._dg.retry_login()
@@ -14,16 +14,32 @@
 
 """Various utility functions."""
 
+import base64
 import grpc
+import json
 import sys
 
 from pydgraph.meta import VERSION
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
 __author__ = 'Shailesh Kochhar <shailesh.kochhar@gmail.com>'
 __maintainer__ = 'Dgraph Labs <contact@dgraph.io>' 
 __version__ = VERSION
 __status__ = 'development'
 
+# Status codes Dgraph uses to report an aborted transaction.
+_ABORTED_CODES = frozenset((grpc.StatusCode.ABORTED,
+                            grpc.StatusCode.FAILED_PRECONDITION))
+
 
 def is_string(string):
     """Checks if argument is a string. Compatible with Python 2 and 3."""
@@ -32,18 +48,72 @@ def is_string(string):
 
     return isinstance(string, str)
 
+# ensure_ascii is kept so that lone surrogates are escaped rather than failing
+# to encode as UTF-8.
+_json_encode = json.JSONEncoder(separators=(',', ':')).encode
+
+
+def _stdlib_json_dumps(obj):
+    """Serializes obj to UTF-8 encoded JSON bytes."""
+    return _json_encode(obj).encode('utf8')
+
+
+def _orjson_dumps(obj):
+    """Serializes obj to UTF-8 encoded JSON bytes."""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+json_dumps = _stdlib_json_dumps
+
+
+def set_json_encoder(name):
+    """Sets the encoder used for set_obj and del_obj mutations.
+
+    name is one of 'json' (the default), 'orjson' or 'msgspec'. orjson and
+    msgspec are faster, but do not accept exactly the same objects as the json
+    module; see the README for the differences.
+    """
+    global json_dumps
+    if name == 'json':
+        json_dumps = _stdlib_json_dumps
+    elif name == 'orjson':
+        if orjson is None:
+            raise ImportError('orjson is not installed')
+        json_dumps = _orjson_dumps
+    elif name == 'msgspec':
+        if msgspec is None:
+            raise ImportError('msgspec is not installed')
+        json_dumps = msgspec.json.Encoder().encode
+    else:
+        raise ValueError('unknown JSON encoder {!r}'.format(name))
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+def jwt_expiry(token):
+    """Returns the expiry time (exp claim) of a JWT, or None if it has none."""
+    try:
+        # JWTs drop the base64 padding. The decoder ignores any excess
+        # padding, so appending the most that may be missing is enough.
+        claims = _json_loads(base64.urlsafe_b64decode(
+            token.split('.')[1] + '=='))
+        return float(claims['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
 def is_jwt_expired(exception):
     return 'Token is expired' in str(exception)
 
 def is_aborted_error(error):
     """Returns true if the error is due to an aborted transaction."""
-    if isinstance(error, grpc._channel._Rendezvous) or \
-       isinstance(error, grpc._channel._InactiveRpcError):
-        status_code = error.code()
-        if (status_code == grpc.StatusCode.ABORTED or
-            status_code == grpc.StatusCode.FAILED_PRECONDITION):
-            return True
-    return False
+    return _status_code(error) in _ABORTED_CODES
+
+def _status_code(error):
+    """Returns the gRPC status code of error, or None if it has none."""
+    if isinstance(error, grpc.RpcError):
+        code = getattr(error, 'code', None)
+        if code is not None:
+            return code()
+    return None
 
 def is_retriable_error(error):
     """Returns true if the error is retriable (e.g server is not ready yet)."""
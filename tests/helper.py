@@ -17,11 +17,19 @@
 __author__ = 'Garvit Pahal'
 __maintainer__ = 'Dgraph Labs <contact@dgraph.io>' 
 
+import asyncio
+import base64
+import json
 import os
 import time
 import unittest
+from concurrent import futures
+
+import grpc
 
 import pydgraph
+from pydgraph.proto import api_pb2 as api
+from pydgraph.proto import api_pb2_grpc as api_grpc
 
 
 SERVER_ADDR = 'localhost:9180'
@@ -49,6 +57,173 @@ def setup():
     return client
 
 
+class RecordingServicer(api_grpc.DgraphServicer):
+    """Dgraph servicer answering version checks and recording the metadata
+    of every call it receives."""
+
+    def __init__(self):
+        self.metadata = []
+
+    def CheckVersion(self, request, context):
+        self.metadata.append(dict(context.invocation_metadata()))
+        return api.Version(tag='v-test')
+
+
+def start_server(servicer):
+    """Starts an in-process gRPC server for servicer and returns it along
+    with its address."""
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+    api_grpc.add_DgraphServicer_to_server(servicer, server)
+    port = server.add_insecure_port('127.0.0.1:0')
+    server.start()
+    return server, '127.0.0.1:{}'.format(port)
+
+
+class UnavailableError(grpc.RpcError):
+    """RPC error with the UNAVAILABLE status code."""
+
+    def code(self):
+        return grpc.StatusCode.UNAVAILABLE
+
+
+def make_jwt(exp):
+    """Returns an unsigned JWT expiring at exp."""
+    payload = base64.urlsafe_b64encode(json.dumps({'exp': exp}).encode())
+    return 'e30.' + payload.decode().rstrip('=') + '.sig'
+
+
+class FakeStub(object):
+    """Client stub answering requests without a server.
+
+    The first expired requests fail with an expired JWT, and logins raise the
+    errors in login_errors in turn. Access JWTs are numbered by login, or
+    expire after jwt_ttl seconds if it is set. Queries answer with their
+    text and start_ts 3, commits with the next commit_ts, and version checks
+    with tag. Alter requests are only sent as futures, which complete with
+    the next of alter_outcomes, a Payload or an Exception, and are left
+    pending once they run out.
+
+    The name, timeout, metadata and future of every request are recorded.
+    """
+
+    def __init__(self, expired=0, tag='v1', jwt_ttl=None, login_errors=(),
+                 alter_outcomes=()):
+        self.expired = expired
+        self.tag = tag
+        self.jwt_ttl = jwt_ttl
+        self.login_errors = list(login_errors)
+        self.alter_outcomes = list(alter_outcomes)
+        self.logins = 0
+        self.sent = []
+        self.metadata = []
+        self.futures = []
+        self.timeout = None
+
+    def _login(self):
+        self.logins += 1
+        if self.login_errors:
+            raise self.login_errors.pop(0)
+        if self.jwt_ttl is None:
+            access_jwt = 'access%d' % self.logins
+        else:
+            access_jwt = make_jwt(time.time() + self.jwt_ttl)
+        jwt = api.Jwt(access_jwt=access_jwt, refresh_jwt='refresh')
+        return api.Response(json=jwt.SerializeToString())
+
+    def _send(self, method, timeout, metadata, respond):
+        self.sent.append(method)
+        self.timeout = timeout
+        self.metadata.append(metadata)
+        future = futures.Future()
+        self.futures.append(future)
+        if self.expired:
+            self.expired -= 1
+            future.set_exception(Exception('Token is expired'))
+            return future
+        try:
+            result = respond()
+        except Exception as error:
+            future.set_exception(error)
+        else:
+            if result is not None:
+                future.set_result(result)
+        return future
+
+    def _alter(self):
+        if not self.alter_outcomes:
+            return None
+        outcome = self.alter_outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def login(self, login_req, timeout=None, metadata=None, credentials=None):
+        return self._login()
+
+    def async_query(self, req, timeout=None, metadata=None, credentials=None):
+        return self._send('query', timeout, metadata, lambda: api.Response(
+            json=req.query.encode(), txn=api.TxnContext(start_ts=3)))
+
+    def async_commit_or_abort(self, ctx, timeout=None, metadata=None,
+                              credentials=None):
+        return self._send('commit_or_abort', timeout, metadata,
+                          lambda: api.TxnContext(start_ts=ctx.start_ts,
+                                                 commit_ts=ctx.start_ts + 1))
+
+    def async_check_version(self, check, timeout=None, metadata=None,
+                            credentials=None):
+        return self._send('check_version', timeout, metadata,
+                          lambda: api.Version(tag=self.tag))
+
+    def async_alter(self, operation, timeout=None, metadata=None,
+                    credentials=None):
+        return self._send('alter', timeout, metadata, self._alter)
+
+    def query(self, req, timeout=None, metadata=None, credentials=None):
+        return self.async_query(req, timeout, metadata).result()
+
+    def commit_or_abort(self, ctx, timeout=None, metadata=None,
+                        credentials=None):
+        return self.async_commit_or_abort(ctx, timeout, metadata).result()
+
+    def check_version(self, check, timeout=None, metadata=None,
+                      credentials=None):
+        return self.async_check_version(check, timeout, metadata).result()
+
+
+class AsyncFakeStub(FakeStub):
+    """FakeStub for the asyncio client, whose requests are coroutines."""
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncFakeStub, self).__init__(*args, **kwargs)
+        self.closed = None
+
+    async def _result(self, future):
+        # Let other requests run, as a real network call would.
+        await asyncio.sleep(0)
+        return future.result()
+
+    async def login(self, login_req, timeout=None, metadata=None,
+                    credentials=None):
+        return self._login()
+
+    async def query(self, req, timeout=None, metadata=None, credentials=None):
+        return await self._result(self.async_query(req, timeout, metadata))
+
+    async def commit_or_abort(self, ctx, timeout=None, metadata=None,
+                              credentials=None):
+        return await self._result(
+            self.async_commit_or_abort(ctx, timeout, metadata))
+
+    async def check_version(self, check, timeout=None, metadata=None,
+                            credentials=None):
+        return await self._result(
+            self.async_check_version(check, timeout, metadata))
+
+    async def close(self, grace=None):
+        self.closed = grace
+
+
 class ClientIntegrationTestCase(unittest.TestCase):
     """Base class for other integration test cases. Provides a client object
     with a connection to the dgraph server.
@@ -0,0 +1,189 @@
+# Copyright 2023 Dgraph Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests the asyncio Dgraph client and transactions."""
+
+__maintainer__ = 'Dgraph Labs <contact@dgraph.io>'
+
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+import pydgraph
+from . import helper
+
+
+class TestAsyncDgraphClient(unittest.TestCase):
+    def test_constructor(self):
+        with self.assertRaises(ValueError):
+            pydgraph.AsyncDgraphClient()
+
+    def test_login_and_expired_jwt(self):
+        stub = helper.AsyncFakeStub()
+        client = pydgraph.AsyncDgraphClient(stub)
+
+        async def run():
+            await client.login('groot', 'password')
+            stub.expired = 1
+            return await client.check_version()
+
+        self.assertEqual('v1', asyncio.run(run()))
+        self.assertEqual(2, stub.logins)
+        self.assertEqual([(('accessjwt', 'access1'),), (('accessjwt', 'access2'),)],
+                         stub.metadata)
+
+    def test_concurrent_expired_jwt_refreshed_once(self):
+        stub = helper.AsyncFakeStub()
+        client = pydgraph.AsyncDgraphClient(stub)
+
+        async def run():
+            await client.login('groot', 'password')
+            stub.expired = 5
+            return await asyncio.gather(*[client.check_version()
+                                          for _ in range(5)])
+
+        self.assertEqual(['v1'] * 5, asyncio.run(run()))
+        self.assertEqual(2, stub.logins)
+
+    def test_failed_early_refresh(self):
+        stub = helper.AsyncFakeStub()
+        client = pydgraph.AsyncDgraphClient(stub)
+
+        async def run():
+            await client.login('groot', 'password')
+            client._jwt_refresh_at = time.time() - 1
+            stub.login_errors = [Exception('login failed')]
+            return await client.check_version()
+
+        self.assertEqual('v1', asyncio.run(run()))
+        self.assertIsNone(client._jwt_refresh_at)
+        self.assertEqual(2, stub.logins)
+        self.assertEqual([(('accessjwt', 'access1'),)], stub.metadata)
+
+    def test_retry_login_unavailable(self):
+        stub = helper.AsyncFakeStub(login_errors=[helper.UnavailableError()])
+        client = pydgraph.AsyncDgraphClient(stub)
+        client._jwt.refresh_jwt = 'refresh'
+        delays = []
+
+        async def sleep(delay):
+            delays.append(delay)
+
+        with mock.patch('pydgraph.async_client.asyncio.sleep', sleep):
+            asyncio.run(client.retry_login())
+        self.assertEqual(2, stub.logins)
+        self.assertEqual(1, len(delays))
+
+    def test_warmup(self):
+        client = pydgraph.AsyncDgraphClient(helper.AsyncFakeStub(),
+                                            helper.AsyncFakeStub())
+        self.assertEqual(['v1', 'v1'], asyncio.run(client.warmup()))
+
+    def test_close(self):
+        stubs = [helper.AsyncFakeStub(), helper.AsyncFakeStub()]
+        asyncio.run(pydgraph.AsyncDgraphClient(*stubs).close(grace=1))
+        self.assertEqual([1, 1], [stub.closed for stub in stubs])
+
+
+class TestAsyncTxn(unittest.TestCase):
+    def test_query_and_commit(self):
+        stub = helper.AsyncFakeStub(expired=1)
+        client = pydgraph.AsyncDgraphClient(stub)
+        client._jwt.refresh_jwt = 'refresh'
+
+        async def run():
+            txn = client.txn()
+            await txn.mutate(set_obj={'name': 'Alice'})
+            self.assertEqual(3, txn._ctx.start_ts)
+            return await txn.commit()
+
+        self.assertEqual(4, asyncio.run(run()).commit_ts)
+        self.assertEqual(1, stub.logins)
+
+    def test_context_manager(self):
+        stub = helper.AsyncFakeStub()
+        client = pydgraph.AsyncDgraphClient(stub)
+
+        async def run():
+            async with client.txn() as txn:
+                await txn.mutate(set_nquads='_:a <name> "A" .')
+            return txn
+
+        txn = asyncio.run(run())
+        self.assertTrue(txn._ctx.aborted)
+        self.assertEqual(2, len(stub.metadata))
+
+    def test_context_manager_keeps_error(self):
+        stub = helper.AsyncFakeStub()
+        client = pydgraph.AsyncDgraphClient(stub)
+
+        async def run():
+            async with client.txn() as txn:
+                await txn.mutate(set_nquads='_:a <name> "A" .')
+                # The discard on exit fails, but the KeyError is kept.
+                stub.expired = 2
+                raise KeyError('k')
+
+        with self.assertRaises(KeyError):
+            asyncio.run(run())
+
+    def test_cancelled_discard(self):
+        stub = helper.AsyncFakeStub()
+        client = pydgraph.AsyncDgraphClient(stub)
+
+        async def cancelled(*args, **kwargs):
+            raise asyncio.CancelledError()
+
+        async def exit_block():
+            async with client.txn() as txn:
+                await txn.mutate(set_nquads='_:a <name> "A" .')
+                stub.commit_or_abort = cancelled
+                raise KeyError('k')
+
+        async def failed_request():
+            txn = client.txn()
+            txn._mutated = True
+            stub.expired = 1
+            await txn.query('{ q() }')
+
+        # A cancellation while discarding is not hidden by the original error.
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(exit_block())
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(failed_request())
+
+    def test_finished(self):
+        client = pydgraph.AsyncDgraphClient(helper.AsyncFakeStub())
+
+        async def run():
+            txn = client.txn()
+            await txn.query('{ q() }')
+            await txn.discard()
+            await txn.query('{ q() }')
+
+        with self.assertRaises(pydgraph.errors.TransactionError):
+            asyncio.run(run())
+
+
+def suite():
+    """Returns a tests suite object."""
+    suite_obj = unittest.TestSuite()
+    suite_obj.addTest(TestAsyncDgraphClient())
+    suite_obj.addTest(TestAsyncTxn())
+    return suite_obj
+
+if __name__ == '__main__':
+    runner = unittest.TextTestRunner()
+    runner.run(suite())
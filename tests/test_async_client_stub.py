@@ -0,0 +1,206 @@
+# Copyright 2023 Dgraph Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests the asyncio client stub."""
+
+__maintainer__ = 'Dgraph Labs <contact@dgraph.io>'
+
+import asyncio
+import unittest
+from unittest import mock
+
+import grpc
+from grpc import aio
+
+import pydgraph
+from . import helper
+
+
+class RecordingInterceptor(aio.UnaryUnaryClientInterceptor):
+    """Interceptor recording the name of every method called."""
+
+    def __init__(self):
+        self.methods = []
+
+    async def intercept_unary_unary(self, continuation, details, request):
+        self.methods.append(details.method)
+        return await continuation(details, request)
+
+
+class TestAsyncDgraphClientStub(helper.ClientIntegrationTestCase):
+    """Tests the asyncio client stub."""
+
+    async def check_version(self, stub):
+        version = await stub.check_version(pydgraph.Check())
+        self.assertIsInstance(version.tag, str)
+
+    def test_constructor(self):
+        async def run():
+            stub = pydgraph.AsyncDgraphClientStub(addr=self.TEST_SERVER_ADDR)
+            await self.check_version(stub)
+            await stub.close()
+
+        asyncio.run(run())
+
+    def test_timeout(self):
+        async def run():
+            async with pydgraph.AsyncDgraphClientStub(self.TEST_SERVER_ADDR) as stub:
+                await stub.check_version(pydgraph.Check(), timeout=-1)
+
+        with self.assertRaises(Exception):
+            asyncio.run(run())
+
+    def test_close(self):
+        async def run():
+            stub = pydgraph.AsyncDgraphClientStub(addr=self.TEST_SERVER_ADDR)
+            await self.check_version(stub)
+            await stub.close(grace=1)
+            with self.assertRaises(Exception):
+                await stub.check_version(pydgraph.Check())
+            # A second close is a no-op.
+            await stub.close()
+
+        asyncio.run(run())
+
+    def test_context_manager(self):
+        async def run():
+            async with pydgraph.AsyncDgraphClientStub(
+                    addr=self.TEST_SERVER_ADDR) as stub:
+                await self.check_version(stub)
+            with self.assertRaises(Exception):
+                await stub.check_version(pydgraph.Check())
+
+        asyncio.run(run())
+
+    def test_shared_channel(self):
+        async def run():
+            channel = aio.insecure_channel(self.TEST_SERVER_ADDR)
+            stub1 = pydgraph.AsyncDgraphClientStub(channel=channel)
+            stub2 = pydgraph.AsyncDgraphClientStub(channel=channel)
+            await self.check_version(stub1)
+            await stub1.close()
+            # Closing a stub must not close a channel it does not own.
+            await self.check_version(stub2)
+            await stub2.close()
+            await channel.close()
+
+            with self.assertRaises(ValueError):
+                pydgraph.AsyncDgraphClientStub(channel=channel, pool_size=2)
+
+        asyncio.run(run())
+
+    def test_pool(self):
+        async def run():
+            stub = pydgraph.AsyncDgraphClientStub(self.TEST_SERVER_ADDR,
+                                                  pool_size=3)
+            await asyncio.gather(*[self.check_version(stub) for _ in range(6)])
+            await stub.close()
+
+        asyncio.run(run())
+
+        with self.assertRaises(ValueError):
+            pydgraph.AsyncDgraphClientStub(self.TEST_SERVER_ADDR, pool_size=0)
+
+    def test_compression(self):
+        async def run():
+            stub = pydgraph.AsyncDgraphClientStub(
+                self.TEST_SERVER_ADDR, compression=grpc.Compression.Gzip)
+            await self.check_version(stub)
+            await stub.close()
+
+        asyncio.run(run())
+
+    def test_interceptors(self):
+        interceptor = RecordingInterceptor()
+
+        async def run():
+            stub = pydgraph.AsyncDgraphClientStub(self.TEST_SERVER_ADDR,
+                                                  interceptors=[interceptor])
+            await self.check_version(stub)
+            await stub.close()
+
+        asyncio.run(run())
+        self.assertEqual([b'/api.Dgraph/CheckVersion'], interceptor.methods)
+
+    def test_client(self):
+        async def run():
+            stub = pydgraph.AsyncDgraphClientStub(self.TEST_SERVER_ADDR)
+            client = pydgraph.AsyncDgraphClient(stub)
+            await client.login('groot', 'password')
+            self.assertIsInstance(await client.check_version(), str)
+            await client.close()
+
+        asyncio.run(run())
+
+
+class TestAsyncFromCloud(unittest.TestCase):
+    """Tests the from_cloud function of the asyncio client stub."""
+
+    def test_from_cloud(self):
+        async def run():
+            options = [('grpc.max_receive_message_length', 1024)]
+            stub = pydgraph.AsyncDgraphClientStub.from_cloud(
+                "https://godly.grpc.region.aws.cloud.dgraph.io:443", "api-key",
+                options=options)
+            await stub.close()
+            # The caller's options are left untouched.
+            self.assertEqual([('grpc.max_receive_message_length', 1024)], options)
+
+            with self.assertRaises(IndexError):
+                pydgraph.AsyncDgraphClientStub.from_cloud("random:url", "api-key")
+
+        asyncio.run(run())
+
+    def test_from_cloud_metadata(self):
+        servicer = helper.RecordingServicer()
+        server, addr = helper.start_server(servicer)
+        create_channel = pydgraph.AsyncDgraphClientStub._create_channel
+
+        def local_channel(target, credentials, options, compression=None,
+                          interceptors=None):
+            # The cloud endpoint is served by the local server in plaintext.
+            return create_channel(addr, None, options, compression, interceptors)
+
+        async def run():
+            with mock.patch.object(pydgraph.AsyncDgraphClientStub,
+                                   '_create_channel', staticmethod(local_channel)):
+                stub = pydgraph.AsyncDgraphClientStub.from_cloud(
+                    "godly.grpc.region.aws.cloud.dgraph.io", "api-key")
+            async with stub:
+                await stub.check_version(pydgraph.Check(), metadata=[('x', 'y')])
+
+        try:
+            asyncio.run(run())
+        finally:
+            server.stop(None)
+
+        self.assertEqual(1, len(servicer.metadata))
+        self.assertEqual('api-key', servicer.metadata[0]['authorization'])
+        self.assertEqual('y', servicer.metadata[0]['x'])
+
+    def test_parse_host(self):
+        self.assertEqual("godly.grpc.region.aws.cloud.dgraph.io",
+                         pydgraph.AsyncDgraphClientStub.parse_host(
+                             "godly.region.aws.cloud.dgraph.io:random"))
+
+
+def suite():
+    """Returns a test suite object."""
+    suite_obj = unittest.TestSuite()
+    suite_obj.addTest(TestAsyncDgraphClientStub())
+    return suite_obj
+
+if __name__ == '__main__':
+    runner = unittest.TextTestRunner()
+    runner.run(suite())
@@ -17,8 +17,17 @@
 __author__ = 'Garvit Pahal'
 __maintainer__ = 'Dgraph Labs <contact@dgraph.io>' 
 
+import time
 import unittest
+from unittest import mock
+
+import grpc
+
 import pydgraph
+from . import helper
+
+RETRY_ERROR = Exception('Please retry again, server is not ready')
+
 
 class TestDgraphClient(unittest.TestCase):
     """Tests construction of Dgraph client."""
@@ -26,6 +35,200 @@ class TestDgraphClient(unittest.TestCase):
         with self.assertRaises(ValueError):
             pydgraph.DgraphClient()
 
+    def test_any_client_round_robin(self):
+        stubs = [helper.FakeStub() for _ in range(3)]
+        client = pydgraph.DgraphClient(*stubs)
+        self.assertEqual(stubs * 2, [client.any_client() for _ in range(6)])
+
+    def test_patch_instance(self):
+        client = pydgraph.DgraphClient(helper.FakeStub())
+        with mock.patch.object(client, 'retry_login') as retry_login:
+            client.retry_login()
+        retry_login.assert_called_once_with()
+        client.any_client = mock.Mock()
+
+        # Stub methods patched after the first request are used too.
+        stub = helper.FakeStub()
+        client = pydgraph.DgraphClient(stub)
+        client._jwt.refresh_jwt = 'refresh'
+        client.retry_login()
+        with mock.patch.object(stub, 'login', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                client.retry_login()
+
+        stub = pydgraph.DgraphClientStub()
+        with mock.patch.object(stub, 'query') as query:
+            stub.query(pydgraph.Request())
+        query.assert_called_once_with(pydgraph.Request())
+        stub.close()
+
+    @mock.patch('pydgraph.client.time.sleep')
+    def test_retry_login_backoff(self, sleep):
+        stub = helper.FakeStub(login_errors=[RETRY_ERROR] * 2)
+        client = pydgraph.DgraphClient(stub)
+        client._jwt.refresh_jwt = 'refresh'
+        client.retry_login()
+        self.assertEqual(3, stub.logins)
+        self.assertEqual(2, sleep.call_count)
+
+        stub = helper.FakeStub(login_errors=[helper.UnavailableError()])
+        client = pydgraph.DgraphClient(stub)
+        client._jwt.refresh_jwt = 'refresh'
+        client.retry_login()
+        self.assertEqual(2, stub.logins)
+
+    @mock.patch('pydgraph.client.time.sleep')
+    def test_retry_login_gives_up(self, sleep):
+        stub = helper.FakeStub(login_errors=[RETRY_ERROR] * 5)
+        client = pydgraph.DgraphClient(stub)
+        client._jwt.refresh_jwt = 'refresh'
+        with self.assertRaises(Exception):
+            client.retry_login()
+        self.assertEqual(3, stub.logins)
+
+    def test_add_login_metadata(self):
+        client = pydgraph.DgraphClient(helper.FakeStub())
+        self.assertEqual((), client.add_login_metadata(None))
+        client._jwt.refresh_jwt = 'refresh'
+        client.retry_login()
+        login_metadata = client.add_login_metadata(None)
+        self.assertEqual((('accessjwt', 'access1'),), login_metadata)
+        self.assertIs(login_metadata, client.add_login_metadata([]))
+        self.assertEqual((('accessjwt', 'access1'), ('x', 'y')),
+                         client.add_login_metadata([('x', 'y')]))
+
+    def test_retry_login_once(self):
+        stub = helper.FakeStub()
+        client = pydgraph.DgraphClient(stub)
+        client._jwt.refresh_jwt = 'refresh'
+        jwt_version = client._jwt_version
+        # Two requests failed with the same expired token.
+        client._retry_login_once(jwt_version)
+        client._retry_login_once(jwt_version)
+        self.assertEqual(1, stub.logins)
+        client._retry_login_once(client._jwt_version)
+        self.assertEqual(2, stub.logins)
+
+    def test_warmup(self):
+        stubs = [helper.FakeStub(tag='v%d' % i) for i in range(3)]
+        client = pydgraph.DgraphClient(*stubs)
+        self.assertEqual(['v0', 'v1', 'v2'], client.warmup(timeout=5))
+        self.assertEqual([5, 5, 5], [stub.timeout for stub in stubs])
+
+    def test_refresh_jwt_ahead_of_expiry(self):
+        stub = helper.FakeStub(jwt_ttl=3600)
+        client = pydgraph.DgraphClient(stub)
+        client.login('groot', 'password')
+        client.check_version()
+        self.assertEqual(1, stub.logins)
+
+        # The token is about to expire, so it is refreshed before the request.
+        client._jwt_refresh_at = time.time() - 1
+        client.check_version()
+        self.assertEqual(2, stub.logins)
+
+        # Tokens already within the refresh window are not refreshed ahead.
+        stub.jwt_ttl = 1
+        client.login('groot', 'password')
+        self.assertIsNone(client._jwt_refresh_at)
+        client.check_version()
+        self.assertEqual(3, stub.logins)
+
+    def test_pipeline(self):
+        stub = helper.FakeStub(expired=2,
+                               alter_outcomes=[Exception('Please retry')])
+        client = pydgraph.DgraphClient(stub)
+        client.login('groot', 'password')
+        responses = client.pipeline(
+            ('query', pydgraph.Request(query='a')),
+            ('check_version', pydgraph.Check()),
+            ('query', pydgraph.Request(query='b')))
+        self.assertEqual([b'a', 'v1', b'b'],
+                         [responses[0].json, responses[1].tag,
+                          responses[2].json])
+        # Both expired requests share a single refresh.
+        self.assertEqual(2, stub.logins)
+
+        with self.assertRaises(pydgraph.errors.RetriableError):
+            client.pipeline(('query', pydgraph.Request(query='a')),
+                            ('alter', pydgraph.Operation(drop_all=True)))
+
+        with self.assertRaises(ValueError):
+            client.pipeline(('query', pydgraph.Request(query='a')),
+                            ('login', pydgraph.proto.api_pb2.LoginRequest()))
+
+    def test_pipeline_all_expired(self):
+        stub = helper.FakeStub(expired=3)
+        client = pydgraph.DgraphClient(stub)
+        client.login('groot', 'password')
+        responses = client.pipeline(*[('query', pydgraph.Request(query=q))
+                                      for q in 'abc'])
+        self.assertEqual([b'a', b'b', b'c'], [r.json for r in responses])
+        self.assertEqual(2, stub.logins)
+        # The rejected requests are sent again as one batch of futures.
+        self.assertEqual(['query'] * 6, stub.sent)
+
+    @mock.patch('pydgraph.client.time.sleep')
+    def test_pipeline_failed_login(self, sleep):
+        stub = helper.FakeStub(expired=1,
+                               login_errors=[Exception('Please retry')] * 3)
+        client = pydgraph.DgraphClient(stub)
+        client._jwt.refresh_jwt = 'refresh'
+        # The login error is not mapped as if alter had failed.
+        with self.assertRaises(Exception) as context:
+            client.pipeline(('alter', pydgraph.Operation(drop_all=True)))
+        self.assertNotIsInstance(context.exception, pydgraph.errors.RetriableError)
+        self.assertEqual(['alter'], stub.sent)
+
+    @mock.patch('pydgraph.client.time.sleep')
+    def test_failed_early_refresh(self, sleep):
+        stub = helper.FakeStub(jwt_ttl=3600)
+        client = pydgraph.DgraphClient(stub)
+        client.login('groot', 'password')
+        client._jwt_refresh_at = time.time() - 1
+        stub.login_errors = [Exception('login failed')]
+        # The request is still sent with the current token.
+        self.assertEqual('v1', client.check_version())
+        self.assertEqual(2, stub.logins)
+        self.assertIsNone(client._jwt_refresh_at)
+        self.assertEqual('v1', client.check_version())
+        self.assertEqual(2, stub.logins)
+
+    def test_async_alter_expired_jwt(self):
+        stub = helper.FakeStub(expired=1,
+                               alter_outcomes=[pydgraph.Payload(Data=b'ok')])
+        client = pydgraph.DgraphClient(stub)
+        client.login('groot', 'password')
+        future = client.async_alter(pydgraph.Operation(schema='name: string .'))
+        self.assertEqual(b'ok', pydgraph.DgraphClient.handle_alter_future(future).Data)
+        self.assertEqual(2, stub.logins)
+
+    def test_async_alter_expired_jwt_then_error(self):
+        stub = helper.FakeStub(expired=1,
+                               alter_outcomes=[Exception('Please retry')])
+        client = pydgraph.DgraphClient(stub)
+        client.login('groot', 'password')
+        future = client.async_alter(pydgraph.Operation(schema='name: string .'))
+        with self.assertRaises(pydgraph.errors.RetriableError):
+            pydgraph.DgraphClient.handle_alter_future(future)
+        self.assertEqual(2, stub.logins)
+
+    def test_async_alter_cancel(self):
+        stub = helper.FakeStub()
+        client = pydgraph.DgraphClient(stub)
+        future = client.async_alter(pydgraph.Operation(schema='name: string .'))
+        self.assertTrue(future.cancel())
+        self.assertTrue(future.cancelled())
+        self.assertTrue(stub.futures[0].cancelled())
+        with self.assertRaises(grpc.FutureCancelledError):
+            future.result()
+
+    def test_close(self):
+        stubs = [mock.Mock(), mock.Mock()]
+        pydgraph.DgraphClient(*stubs).close()
+        for stub in stubs:
+            stub.close.assert_called_once_with()
+
 def suite():
     """Returns a tests suite object."""
     suite_obj = unittest.TestSuite()
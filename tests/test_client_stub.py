@@ -17,9 +17,15 @@
 __author__ = 'Garvit Pahal'
 __maintainer__ = 'Dgraph Labs <contact@dgraph.io>' 
 
-import unittest
+import json
+import os
 import sys
+import threading
+import time
+import unittest
+from unittest import mock
 
+import grpc
 import pydgraph
 from . import helper
 
@@ -51,6 +57,53 @@ class TestDgraphClientStub(helper.ClientIntegrationTestCase):
         client_stub.close()
         with self.assertRaises(Exception):
             client_stub.check_version(pydgraph.Check())
+        # A second close is a no-op.
+        client_stub.close()
+
+    def test_context_manager(self):
+        with pydgraph.DgraphClientStub(addr=self.TEST_SERVER_ADDR) as client_stub:
+            self.check_version(client_stub)
+        with self.assertRaises(Exception):
+            client_stub.check_version(pydgraph.Check())
+
+    def test_shared_channel(self):
+        channel = grpc.insecure_channel(self.TEST_SERVER_ADDR)
+        stub1 = pydgraph.DgraphClientStub(channel=channel)
+        stub2 = pydgraph.DgraphClientStub(channel=channel)
+        self.check_version(stub1)
+        stub1.close()
+        # Closing a stub must not close a channel it does not own.
+        self.check_version(stub2)
+        stub2.close()
+        channel.close()
+
+    def test_pool(self):
+        client_stub = pydgraph.DgraphClientStub(self.TEST_SERVER_ADDR, pool_size=3)
+        for _ in range(6):
+            self.check_version(client_stub)
+        client_stub.close()
+
+        with self.assertRaises(ValueError):
+            pydgraph.DgraphClientStub(self.TEST_SERVER_ADDR, pool_size=0)
+
+    def test_compression(self):
+        client_stub = pydgraph.DgraphClientStub(
+            self.TEST_SERVER_ADDR, compression=grpc.Compression.Gzip)
+        self.check_version(client_stub)
+        client_stub.close()
+
+    def test_query_many(self):
+        client_stub = pydgraph.DgraphClientStub(addr=self.TEST_SERVER_ADDR)
+        metadata = self.client.add_login_metadata(None)
+        reqs = [pydgraph.Request(query='{ q(func: uid(%d)) { uid } }' % (i + 1),
+                                 read_only=True)
+                for i in range(3)]
+        responses = client_stub.query_many(reqs, metadata=metadata)
+        self.assertEqual(3, len(responses))
+        for i, response in enumerate(responses):
+            self.assertEqual([{'uid': hex(i + 1)}],
+                             json.loads(response.json).get('q'))
+        client_stub.close()
 
 class TestFromCloud(unittest.TestCase):
     """Tests the from_cloud function"""
@@ -75,6 +128,101 @@ class TestFromCloud(unittest.TestCase):
                     # we didn't expect an error
                     raise(e)
 
+    def test_from_cloud_options(self):
+        options = [('grpc.max_receive_message_length', 1024)]
+        pydgraph.DgraphClientStub.from_cloud(
+            "godly.grpc.region.aws.cloud.dgraph.io", "api-key", options=options)
+        # The caller's options are left untouched.
+        self.assertEqual([('grpc.max_receive_message_length', 1024)], options)
+
+    def test_from_cloud_metadata(self):
+        servicer = helper.RecordingServicer()
+        server, addr = helper.start_server(servicer)
+        create_channel = pydgraph.DgraphClientStub._create_channel
+
+        def local_channel(target, credentials, options, compression=None,
+                          interceptors=()):
+            # The cloud endpoint is served by the local server in plaintext.
+            return create_channel(addr, None, options, compression, interceptors)
+
+        with mock.patch.object(pydgraph.DgraphClientStub, '_create_channel',
+                               staticmethod(local_channel)):
+            stub = pydgraph.DgraphClientStub.from_cloud(
+                "godly.grpc.region.aws.cloud.dgraph.io", "api-key")
+        try:
+            stub.check_version(pydgraph.Check(), metadata=[('x', 'y')])
+        finally:
+            stub.close()
+            server.stop(None)
+
+        self.assertEqual(1, len(servicer.metadata))
+        self.assertEqual('api-key', servicer.metadata[0]['authorization'])
+        self.assertEqual('y', servicer.metadata[0]['x'])
+
+    def test_parse_host(self):
+        host = "godly.grpc.region.aws.cloud.dgraph.io"
+        for endpoint in ["godly.grpc.region.aws.cloud.dgraph.io",
+                         "godly.grpc.region.aws.cloud.dgraph.io:443",
+                         "https://godly.grpc.region.aws.cloud.dgraph.io:443",
+                         "https://godly.region.aws.cloud.dgraph.io/graphql",
+                         "http://godly.region.aws.cloud.dgraph.io",
+                         "godly.region.aws.cloud.dgraph.io:random"]:
+            self.assertEqual(host, pydgraph.DgraphClientStub.parse_host(endpoint))
+
+        for endpoint in ["random:url", "google", "https://", ""]:
+            with self.assertRaises(IndexError):
+                pydgraph.DgraphClientStub.parse_host(endpoint)
+
+@unittest.skipIf(not hasattr(os, 'register_at_fork'), 'os.fork is not available.')
+class TestFork(unittest.TestCase):
+    """Tests that a forked child reopens the channels of a stub."""
+
+    def test_reconnect_in_child(self):
+        stub = pydgraph.DgraphClientStub('localhost:1', pool_size=2)
+        parent_channels = list(stub._channels)
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            ok = False
+            try:
+                created = []
+                create_channel = stub._create_channel
+
+                def counting_create_channel(*args):
+                    created.append(args)
+                    # Widen the window in which other threads could also
+                    # start reconnecting.
+                    time.sleep(0.05)
+                    return create_channel(*args)
+
+                stub._create_channel = counting_create_channel
+                barrier = threading.Barrier(4)
+
+                def first_call():
+                    barrier.wait()
+                    stub._query()
+
+                threads = [threading.Thread(target=first_call) for _ in range(4)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                ok = (len(created) == 2 and
+                      not set(map(id, stub._channels)) & set(map(id, parent_channels)))
+            finally:
+                os.write(write_fd, b'1' if ok else b'0')
+                os._exit(0)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd, 'rb') as child:
+            result = child.read()
+        os.waitpid(pid, 0)
+        stub.close()
+        self.assertEqual(b'1', result)
+        # The parent keeps its channels.
+        self.assertEqual(parent_channels, stub._channels)
+
 def suite():
     """Returns a test suite object."""
     suite_obj = unittest.TestSuite()
@@ -19,6 +19,7 @@ import unittest
 import logging
 import json
 import time
+from unittest import mock
 
 import pydgraph
 
@@ -574,10 +575,95 @@ class TestSPStar(helper.ClientIntegrationTestCase):
         self.assertEqual([{'uid': uid1}], json.loads(resp.json).get('me'))
 
 
+class TestTxnWithStub(unittest.TestCase):
+    def test_commit_after_expired_jwt(self):
+        stub = helper.FakeStub(expired=1)
+        client = pydgraph.DgraphClient(stub)
+        client._jwt.refresh_jwt = 'refresh'
+        txn = client.txn()
+        txn._mutated = True
+        self.assertEqual(1, txn.commit().commit_ts)
+        self.assertEqual([(), (('accessjwt', 'access1'),)], stub.metadata)
+
+    def test_context_manager(self):
+        stub = helper.FakeStub()
+        client = pydgraph.DgraphClient(stub)
+        with client.txn(read_only=True) as txn:
+            pass
+        self.assertTrue(txn._finished)
+        self.assertEqual([], stub.metadata)
+
+        with client.txn() as txn:
+            txn._mutated = True
+        self.assertTrue(txn._ctx.aborted)
+        self.assertEqual(1, len(stub.metadata))
+
+        # A failing discard does not hide the error raised in the block.
+        stub.commit_or_abort = mock.Mock(
+            side_effect=Exception('Unhealthy connection'))
+        with self.assertRaises(KeyError):
+            with client.txn() as txn:
+                txn._mutated = True
+                raise KeyError('k')
+
+    def test_patch_discard(self):
+        txn = pydgraph.DgraphClient(helper.FakeStub()).txn()
+        with mock.patch.object(txn, 'discard') as discard:
+            with txn:
+                pass
+        discard.assert_called_once_with()
+
+    def test_async_commit(self):
+        stub = helper.FakeStub()
+        client = pydgraph.DgraphClient(stub)
+        txn = client.txn()
+        self.assertIsNone(pydgraph.Txn.handle_commit_future(txn.async_commit()))
+
+        txn = client.txn()
+        txn._mutated = True
+        future = txn.async_commit()
+        self.assertEqual(1, pydgraph.Txn.handle_commit_future(future).commit_ts)
+        with self.assertRaises(pydgraph.errors.TransactionError):
+            txn.async_commit()
+
+class TestCreateRequest(unittest.TestCase):
+    def test_fields(self):
+        txn = pydgraph.DgraphClient(helper.FakeStub()).txn(read_only=True,
+                                                       best_effort=True)
+        txn._ctx.start_ts = 5
+        req = txn.create_request(query='{ q() }', variables={'$a': 'b'},
+                                 commit_now=True, resp_format='RDF')
+        self.assertEqual(pydgraph.Request(
+            start_ts=5, query='{ q() }', vars={'$a': 'b'}, read_only=True,
+            best_effort=True, commit_now=True,
+            resp_format=pydgraph.Request.RespFormat.RDF), req)
+
+        self.assertEqual(pydgraph.Request(),
+                         pydgraph.DgraphClient(helper.FakeStub()).txn().create_request())
+
+    def test_resp_format(self):
+        txn = pydgraph.DgraphClient(helper.FakeStub()).txn()
+        self.assertEqual(pydgraph.Request.RespFormat.RDF,
+                         txn.create_request(resp_format='rdf').resp_format)
+        with self.assertRaises(pydgraph.errors.TransactionError):
+            txn.create_request(resp_format='XML')
+
+    def test_nquad_lines(self):
+        txn = pydgraph.DgraphClient(helper.FakeStub()).txn()
+        mutation = txn.create_mutation(
+            set_nquads=['_:a <name> "A" .', b'_:b <name> "B" .'],
+            del_nquads=iter(['<0x1> <name> * .']))
+        self.assertEqual(b'_:a <name> "A" .\n_:b <name> "B" .',
+                         mutation.set_nquads)
+        self.assertEqual(b'<0x1> <name> * .', mutation.del_nquads)
+
+
 def suite():
     s = unittest.TestSuite()
     s.addTest(TestTxn())
     s.addTest(TestSPStar())
+    s.addTest(TestTxnWithStub())
+    s.addTest(TestCreateRequest())
     return s
 
 
@@ -17,10 +17,23 @@
 __author__ = 'Garvit Pahal'
 __maintainer__ = 'Dgraph Labs <contact@dgraph.io>' 
 
+import base64
+import json
 import unittest
 
+import grpc
+
 from pydgraph import util
 
+
+class FakeRpcError(grpc.RpcError):
+    def __init__(self, code):
+        self._code = code
+
+    def code(self):
+        return self._code
+
+
 class TestUtil(unittest.TestCase):
     """Tests util utility functions."""
 
@@ -30,6 +43,52 @@ class TestUtil(unittest.TestCase):
         self.assertFalse(util.is_string(object()))
         self.assertFalse(util.is_string({}))
 
+    def test_json_dumps(self):
+        encoded = util.json_dumps({'name': 'Zoë', 'ages': [1, 2.5], 'ok': None})
+        self.assertIsInstance(encoded, bytes)
+        self.assertEqual({'name': 'Zoë', 'ages': [1, 2.5], 'ok': None},
+                         json.loads(encoded.decode('utf8')))
+
+    def test_json_dumps_lone_surrogate(self):
+        self.assertEqual({'a': '\ud800'}, json.loads(util.json_dumps({'a': '\ud800'})))
+
+    def test_set_json_encoder(self):
+        self.addCleanup(util.set_json_encoder, 'json')
+        # The json module is used unless another encoder is chosen.
+        self.assertEqual(b'{"a":NaN}', util.json_dumps({'a': float('nan')}))
+
+        obj = {'name': 'Zoë', 'ages': [1, 2.5], 'ok': None}
+        for name, module in (('orjson', util.orjson), ('msgspec', util.msgspec)):
+            if module is None:
+                with self.assertRaises(ImportError):
+                    util.set_json_encoder(name)
+            else:
+                util.set_json_encoder(name)
+                self.assertEqual(obj, json.loads(util.json_dumps(obj)))
+
+        util.set_json_encoder('json')
+        self.assertEqual(b'{"a":NaN}', util.json_dumps({'a': float('nan')}))
+        with self.assertRaises(ValueError):
+            util.set_json_encoder('simplejson')
+
+    def test_is_aborted_error(self):
+        self.assertTrue(util.is_aborted_error(FakeRpcError(grpc.StatusCode.ABORTED)))
+        self.assertTrue(util.is_aborted_error(
+            FakeRpcError(grpc.StatusCode.FAILED_PRECONDITION)))
+        self.assertFalse(util.is_aborted_error(FakeRpcError(grpc.StatusCode.UNKNOWN)))
+        self.assertFalse(util.is_aborted_error(grpc.RpcError()))
+        self.assertFalse(util.is_aborted_error(Exception('aborted')))
+
+    def test_jwt_expiry(self):
+        # Payloads of any length need their base64 padding restored.
+        for exp in (1700000000, 1700000000.5, 17):
+            payload = base64.urlsafe_b64encode(
+                json.dumps({'exp': exp}).encode()).rstrip(b'=').decode()
+            self.assertEqual(exp, util.jwt_expiry('e30.' + payload + '.sig'))
+
+        for token in ('', 'abc', 'e30.e30.sig', 'e30.!!!.sig'):
+            self.assertIsNone(util.jwt_expiry(token))
+
 def suite():
     """Returns a test suite object."""
     suite_obj = unittest.TestSuite()